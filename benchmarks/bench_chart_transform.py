@@ -0,0 +1,74 @@
+"""Time and memory of ``Chart._transform`` on large ``returnChartData`` replies.
+
+The legacy transform (``perdelta`` index plus a frame built from the list of
+dicts) is reproduced here for comparison.
+
+    python benchmarks/bench_chart_transform.py -n 100000 500000
+"""
+from __future__ import print_function
+
+import argparse
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from ctrade.poloniex import Chart
+from ctrade.utils import perdelta
+
+PERIOD = 300
+
+
+def payload(n, start=1500000000):
+    rng = np.random.RandomState(0)
+    close = 0.07 + np.cumsum(rng.randn(n)) * 1e-4
+    return {'candleStick': [{'date': start + i * PERIOD,
+                             'high': c + 1e-4, 'low': c - 1e-4,
+                             'open': c, 'close': c,
+                             'volume': 12.5, 'quoteVolume': 180.2,
+                             'weightedAverage': c}
+                            for i, c in enumerate(close)]}, start
+
+
+def legacy_transform(chart):
+    series = chart.json['candleStick']
+    times = [i for i in perdelta(chart.start, chart.end,
+                                 timedelta(minutes=5))]
+    if len(times) > len(series):
+        times = times[:-1]
+    elif len(times) < len(series):
+        series = series[:-1]
+    return pd.DataFrame(series, index=times)
+
+
+def bench(name, func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.time()
+        df = func()
+        best = min(best, time.time() - t)
+    size = df.memory_usage(index=True, deep=True).sum() / 2. ** 20
+    print('  {:<10} {:>8.3f}s {:>8.1f} MiB'.format(name, best, size))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chart transform benchmark')
+    parser.add_argument('-n', dest='n', type=int, nargs='+',
+                        default=[100000, 500000])
+    inputs = parser.parse_args()
+
+    for n in inputs.n:
+        json, start = payload(n)
+        chart = Chart('BTC_ETH', json, start, start + n * PERIOD, PERIOD)
+        print('{} candles'.format(n))
+        old = bench('legacy', lambda: legacy_transform(chart))
+        new = bench('float64', chart._transform)
+        chart.dtype = np.float32
+        bench('float32', chart._transform)
+        print('  speedup    {:>8.1f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Speed of the vectorized ``atr`` and ``consecutive`` against the loop
+versions they replaced, which are reproduced here.
+
+The loop versions are only timed up to ``--legacy-max`` rows, past that
+they take minutes.
+
+    python benchmarks/bench_indicators.py -n 10000 100000 1000000 10000000
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ctrade.indicators import atr, consecutive
+
+
+def legacy_atr(df, col_labels=('low', 'high', 'close'), window=14):
+    low = df[col_labels[0]]
+    high = df[col_labels[1]]
+    close = df[col_labels[2]]
+
+    tr_1 = high - low
+    tr_2 = (high - close.shift()).abs()
+    tr_3 = (low - close.shift()).abs()
+
+    max_tr = pd.concat([tr_1, tr_2, tr_3], axis=1).max(axis=1)
+
+    atr = pd.Series(0.0, index=max_tr.index, name='ATR')
+    atr[:window-1] = np.NaN
+    atr[window-1] = max_tr[:window].mean()
+
+    for i in range(window, len(atr)):
+        atr[i] = (atr[i - 1] * (window - 1) + max_tr[i]) / window
+
+    return atr.to_frame('atr_{}'.format(window))
+
+
+def legacy_consecutive(series):
+    series_up = (series - series.shift(1)).copy()
+    series_down = (series.shift(1) - series).copy()
+    y_up = series_up.apply(lambda x: 1 if x>0 else 0)
+    y_up = (y_up * (y_up.groupby((y_up != y_up.shift()).cumsum()).cumcount() + 1)).to_frame('conseq_up')
+    y_down = series_down.apply(lambda x: 1 if x>0 else 0)
+    y_down = (y_down * (y_down.groupby((y_down != y_down.shift()).cumsum()).cumcount() + 1)).to_frame('conseq_down')
+    return y_up.join(y_down)
+
+
+def candles(n):
+    rng = np.random.RandomState(0)
+    close = pd.Series(100 + rng.randn(n).cumsum(),
+                      index=pd.date_range('2017-01-01', periods=n, freq='5T'))
+    return pd.DataFrame({'close': close,
+                         'high': close + rng.rand(n),
+                         'low': close - rng.rand(n)})
+
+
+def timed(func, *args):
+    t = time.time()
+    out = func(*args)
+    return time.time() - t, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Indicator kernel benchmark')
+    parser.add_argument('-n', dest='n', type=int, nargs='+',
+                        default=[10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7])
+    parser.add_argument('--legacy-max', dest='legacy_max', type=int,
+                        default=10 ** 5)
+    inputs = parser.parse_args()
+
+    print('{:>10} {:<12} {:>10} {:>10} {:>9}'.format('rows', 'indicator',
+                                                     'legacy', 'vector',
+                                                     'speedup'))
+    for n in inputs.n:
+        df = candles(n)
+        for name, new, old, arg in [('atr', atr, legacy_atr, df),
+                                    ('consecutive', consecutive,
+                                     legacy_consecutive, df['close'])]:
+            t_new, out = timed(new, arg)
+            if n <= inputs.legacy_max:
+                t_old, ref = timed(old, arg)
+                assert np.allclose(out.values, ref.values, equal_nan=True)
+                print('{:>10} {:<12} {:>9.3f}s {:>9.3f}s {:>8.0f}x'.format(
+                    n, name, t_old, t_new, t_old / t_new))
+            else:
+                print('{:>10} {:<12} {:>10} {:>9.3f}s'.format(n, name, '-',
+                                                            t_new))
+
+
+if __name__ == '__main__':
+    main()
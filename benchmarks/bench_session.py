@@ -0,0 +1,51 @@
+"""Requests per second of the pooled Poloniex transport against a local stub.
+
+Compares one ``urllib2.urlopen`` per query (the previous transport) with the
+keep-alive session used by ``Poloniex.pub_api_query``. Loopback connections
+are almost free, so the stub delays every new connection by ``--handshake-ms``
+to stand in for the TCP/TLS round trips paid against the real exchange.
+
+    python benchmarks/bench_session.py -n 2000 --handshake-ms 30
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import time
+import urllib
+import urllib2
+
+from ctrade import Poloniex, StubExchange, TokenBucket
+
+
+def bench(name, func, n):
+    t = time.time()
+    for _ in range(n):
+        func()
+    elapsed = time.time() - t
+    print('{:<10} {:>8.0f} req/s  ({} requests in {:.2f}s)'.format(
+        name, n / elapsed, n, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Transport benchmark')
+    parser.add_argument('-n', dest='n', type=int, default=1000)
+    parser.add_argument('--handshake-ms', dest='handshake', type=float,
+                        default=20)
+    inputs = parser.parse_args()
+
+    with StubExchange(handshake=inputs.handshake / 1000.) as stub:
+        query = stub.url + '/public?' + urllib.urlencode({'command': 'returnTicker'})
+        bench('urlopen', lambda: json.loads(urllib2.urlopen(query).read()),
+              inputs.n)
+
+        # Measure the transport, not the exchange request budget
+        Poloniex._bucket = TokenBucket(1e9)
+        polo = stub.client()
+        bench('pooled', lambda: polo.pub_api_query({'command': 'returnTicker'}),
+              inputs.n)
+        polo.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,4 +2,16 @@ from .poloniex import *
 from .indicators import *
 from .manager import *
 from .messages import *
-from .utils import *
\ No newline at end of file
+from .utils import *
+from .store import *
+from .ratelimit import *
+from .cache import *
+from .orderbook import *
+from .stub import *
+from .resample import *
+from .nonce import *
+from .streaming import *
+from .graph import *
+from .panel import *
+from .sweep import *
+from .instrument import *
\ No newline at end of file
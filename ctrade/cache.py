@@ -0,0 +1,304 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import errno
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+__all__ = ['SnapshotCache', 'IndicatorCache']
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SnapshotCache(object):
+    """Values refreshed at most once every ``ttl`` seconds.
+
+    The cache is shared between threads: when several of them miss the same
+    key only one calls the loader and the others wait for its result. The
+    cached objects are shared too, so they must not be modified in place.
+    """
+
+    def __init__(self, ttl=10):
+
+        self.ttl = ttl
+        self._values = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None and time.time() - entry[0] < ttl:
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            with self._lock:
+                self._values[key] = (time.time(), flight.value)
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+        return flight.value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+
+class _Fingerprint(object):
+    """Hashes of the rows of a frame or series and a digest of all of them.
+
+    The row hashes, which include the index, tell where two inputs overlap.
+    """
+
+    def __init__(self, data):
+
+        self.rows = pd.util.hash_pandas_object(data, index=True).values
+        columns = data.columns if isinstance(data, pd.DataFrame) else [data.name]
+        digest = hashlib.sha1(repr(list(columns)).encode('utf-8'))
+        digest.update(self.rows.tobytes())
+        self.digest = digest.hexdigest()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def overlap(self, rows):
+        """``(offset, n)``: the first ``n`` rows of this input are the rows
+        of the input hashed into ``rows`` from ``offset`` on."""
+        if not len(self.rows):
+            return 0, 0
+        found = np.flatnonzero(rows == self.rows[0])
+        if not len(found):
+            return 0, 0
+        offset = int(found[0])
+        n = min(len(rows) - offset, len(self.rows))
+        diff = np.flatnonzero(rows[offset:offset+n] != self.rows[:n])
+        return offset, int(diff[0]) if len(diff) else n
+
+
+class IndicatorCache(object):
+    """Indicator results keyed by the indicator and a hash of its input.
+
+    ``key`` identifies an indicator and its parameters, e.g. its config
+    entry, and must have a stable ``repr``. The results are kept in a LRU of
+    ``maxsize`` entries and, if ``path`` is given, pickled to disk where the
+    least recently used files are removed above ``max_bytes``.
+
+    For an indicator with a finite ``lookback``, i.e. whose rows depend only
+    on that many previous rows, the result of the last input is reused for
+    the rows a new input has in common with it, aligned on the index: the
+    same candles with new ones appended, or a window sliding forward as in
+    ``Trading.run``. Only the rest is computed: the rows after the overlap
+    and, when the window slid, its first ``lookback`` rows, whose history
+    is shorter than in the last input.
+
+    The cached results are shared, they must not be modified in place.
+    """
+
+    def __init__(self, maxsize=256, path=None, max_bytes=2**30):
+
+        self.maxsize = maxsize
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.partial_hits = 0
+        self._memory = OrderedDict()
+        self._last = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def __repr__(self):
+        return 'IndicatorCache - {} entries - {}'.format(len(self._memory),
+                                                         self.stats)
+
+    @property
+    def stats(self):
+        """Counters of the lookups, the misses include the partial hits."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'partial_hits': self.partial_hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def fingerprint(self, data):
+        return _Fingerprint(data)
+
+    def _name(self, key, fingerprint):
+        return hashlib.sha1((repr(key) + fingerprint.digest)
+                            .encode('utf-8')).hexdigest()
+
+    def _remember(self, name, value):
+        with self._lock:
+            self._memory.pop(name, None)
+            self._memory[name] = value
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, name):
+        with self._lock:
+            value = self._memory.pop(name, None)
+            if value is not None:
+                self._memory[name] = value
+                return value, False
+        value = self._load(name)
+        if value is not None:
+            self._remember(name, value)
+        return value, value is not None
+
+    def get(self, key, fingerprint):
+        value, disk = self._lookup(self._name(key, fingerprint))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += disk
+        return value
+
+    def overlap(self, key, fingerprint, lookback):
+        """The rows of the last result of ``key`` valid for ``fingerprint``.
+
+        Returns ``(start, stop, values)``, ``values`` being the result on
+        the rows ``start`` to ``stop`` of the new input, or None if the
+        inputs do not share more than ``lookback`` rows.
+        """
+        last = self._last.get(key)
+        if last is None:
+            return None
+        rows, name = last
+        offset, n = fingerprint.overlap(rows)
+        if n <= lookback:
+            return None
+        values, _ = self._lookup(name)
+        if values is None:
+            return None
+        with self._lock:
+            self.partial_hits += 1
+        start = lookback if offset else 0
+        return start, n, values.iloc[offset+start:offset+n]
+
+    def put(self, key, fingerprint, value):
+        name = self._name(key, fingerprint)
+        self._remember(name, value)
+        self._last[key] = (fingerprint.rows, name)
+        if self.path is not None:
+            self._dump(name, value)
+
+    def compute(self, key, data, func, lookback=None):
+        """Return ``func(data)``, from the cache if possible."""
+        fingerprint = self.fingerprint(data)
+        value = self.get(key, fingerprint)
+        if value is not None:
+            return value
+
+        overlap = None
+        if lookback is not None:
+            overlap = self.overlap(key, fingerprint, lookback)
+        if overlap is not None:
+            start, stop, values = overlap
+            parts = [values]
+            if start:
+                parts.insert(0, func(data.iloc[:start]))
+            if stop < len(data):
+                parts.append(func(data.iloc[stop-lookback:]).iloc[lookback:])
+            value = pd.concat(parts)
+        else:
+            value = func(data)
+        self.put(key, fingerprint, value)
+        return value
+
+    def wrap(self, func, key, lookback=None):
+        """Memoize ``func``, a function of one frame or series."""
+        def cached(data):
+            return self.compute(key, data, func, lookback)
+        return cached
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._last.clear()
+
+    # Disk tier
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.pkl')
+
+    def _load(self, name):
+        if self.path is None:
+            return None
+        path = self._file(name)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def _dump(self, name, value):
+        path = self._file(name)
+        tmp = '{}.{}.tmp'.format(path, threading.current_thread().ident)
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        files = []
+        for filename in os.listdir(self.path):
+            if filename.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.path, filename))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, filename))
+        total = sum(size for _, size, _ in files)
+        for _, size, filename in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, filename))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,70 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import re
+import json
+from operator import itemgetter
+import numpy as np
+
+from .exceptions import TransportError, api_error
+from .store import CANDLE_FIELDS, CANDLE_DTYPE
+
+__all__ = ['CandleDecoder']
+
+# Candles are flat objects, so any brace pair without nested braces is one
+CANDLE_RE = re.compile(br'\{[^{}]*\}')
+
+
+class CandleDecoder(object):
+    """Incremental decoder of a ``returnChartData`` reply.
+
+    Chunks of the raw body are fed as they arrive. Every complete candle is
+    decoded straight into a preallocated record array, so only one chunk of
+    text is held in memory at a time. The array doubles in size if
+    ``size_hint`` turns out to be too small.
+    """
+
+    def __init__(self, size_hint=1024):
+
+        self._records = np.empty(max(int(size_hint), 1), dtype=CANDLE_DTYPE)
+        self._n = 0
+        self._tail = b''
+        self._getter = itemgetter(*CANDLE_FIELDS)
+
+    def __len__(self):
+        return self._n
+
+    def feed(self, chunk):
+        data = self._tail + chunk
+        matches = list(CANDLE_RE.finditer(data))
+        if not matches:
+            self._tail = data
+            return
+        self._tail = data[matches[-1].end():]
+
+        objects = [match.group() for match in matches]
+        candles = json.loads(b'[' + b','.join(objects) + b']')
+        if 'error' in candles[0]:
+            raise api_error(candles[0]['error'])
+        self._write(np.array(list(map(self._getter, candles)),
+                             dtype=CANDLE_DTYPE))
+
+    def _write(self, records):
+        n = self._n + len(records)
+        if n > len(self._records):
+            grown = np.empty(max(n, 2 * len(self._records)), dtype=CANDLE_DTYPE)
+            grown[:self._n] = self._records[:self._n]
+            self._records = grown
+        self._records[self._n:n] = records
+        self._n = n
+
+    def close(self):
+        """Return the decoded records.
+
+        Raises ``TransportError`` if the body stopped inside a candle, whose
+        text is left over without its closing brace.
+        """
+        tail = self._tail.strip()
+        if tail and not tail.endswith((b']', b'}')):
+            raise TransportError('Truncated reply after {} candles'.format(self._n))
+        return self._records[:self._n]
@@ -7,3 +7,30 @@ class CurrencyPairException(BaseException):
 class PeriodsException(BaseException):
     """Periods is not available."""
 
+
+class APIError(BaseException):
+    """Poloniex answered with an error message."""
+
+class RateLimitError(APIError):
+    """Request rejected for exceeding the request budget."""
+
+class TransportError(BaseException):
+    """Connection failed, timed out or got a server error."""
+
+class ConnectError(TransportError):
+    """Connection could not be opened, the request was never sent."""
+
+class RetriesExhausted(BaseException):
+    """Request still failing after the allowed retries."""
+
+class NonceError(APIError):
+    """Nonce not greater than the last one seen by the exchange."""
+
+
+def api_error(message):
+    """The exception matching an error message of the exchange."""
+    if 'Please do not make more than' in message:
+        return RateLimitError(message)
+    if 'Nonce must be greater' in message:
+        return NonceError(message)
+    return APIError(message)
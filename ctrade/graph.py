@@ -0,0 +1,298 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple, OrderedDict
+from multiprocessing.pool import ThreadPool
+from operator import itemgetter, sub
+import inspect
+import numpy as np
+import pandas as pd
+
+from . import indicators
+from .instrument import timer
+
+__all__ = ['IndicatorGraph', 'SERIES_INDICATORS']
+
+# Indicators computed on the price series rather than on the candle frame
+SERIES_INDICATORS = ['macd', 'rsi', 'bbands', 'pivot', 'consecutive_periods']
+
+FRAME = ('frame',)
+
+_Node = namedtuple('_Node', ['func', 'deps'])
+
+
+def _freeze(kwargs):
+    return repr(sorted(kwargs.items()))
+
+
+def _defaults(func):
+    spec = inspect.getargspec(func)
+    if not spec.defaults:
+        return {}
+    return dict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+
+
+def _lookback(name, params):
+    """Number of previous rows a row of the indicator depends on, None if it
+    depends on all of them (EWMs, Wilder smoothing, run lengths...)."""
+    if name == 'sma':
+        return params['window'] + params['min_periods']
+    if name in ('rsi', 'bbands'):
+        return params['window'] + params['min_periods'] + 1
+    if name in ('stoc', 'fstoc', 'sstoc'):
+        return (params['window'] + params['k_smooth'] + params['d_smooth'] +
+                params.get('min_periods', 0))
+    return None
+
+
+class IndicatorGraph(object):
+    """The indicators of a ``Model`` as a graph of shared computations.
+
+    The indicators are split into primitives (column lookups, EWMs, rolling
+    windows, diffs) keyed by their inputs and parameters, so a primitive
+    used by several indicators, e.g. the rolling mean of ``bbands`` and of
+    an ``sma`` with the same window, is computed only once. Indicators
+    without a decomposition are kept as one opaque node.
+
+    ``evaluate`` computes the nodes level by level. The nodes of a level are
+    independent of each other and run on a pool of ``max_workers`` threads,
+    which only pays off when the kernels release the GIL. The outputs are
+    the same as those of the functions built by ``Model.set_indicators``.
+    With an ``IndicatorCache`` only the nodes of the indicators missing from
+    it are computed.
+    """
+
+    def __init__(self, indicators, currency, max_workers=1):
+
+        self.currency = currency
+        self.max_workers = max_workers
+        self._nodes = OrderedDict()
+        self.outputs = OrderedDict()
+        self.keys = OrderedDict()
+        self.lookbacks = OrderedDict()
+        for name, (func, kwargs) in indicators.items():
+            self.outputs[name] = self._indicator(func, kwargs or {})
+            self.keys[name] = (func, _freeze(kwargs or {}),
+                               currency if func in SERIES_INDICATORS else None)
+            self.lookbacks[name] = _lookback(func, self._params(func, kwargs or {}))
+        self._levels = self._sort()
+        # Timings are labelled with the indicator for its output node and
+        # with the kind of primitive for the shared ones
+        self._labels = dict((key, key[0]) for key in self._nodes)
+        for name, key in reversed(list(self.outputs.items())):
+            self._labels[key] = name
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __repr__(self):
+        return 'IndicatorGraph - {} indicators - {} nodes - {} levels'.format(
+            len(self.outputs), len(self), len(self._levels))
+
+    def add(self, key, func, *deps):
+        """Add the node ``key`` computed as ``func(*deps)``, unless present."""
+        if key not in self._nodes:
+            self._nodes[key] = _Node(func, deps)
+        return key
+
+    def _sort(self):
+        depth = {FRAME: -1}
+        for key, node in self._nodes.items():
+            depth[key] = 1 + max(depth[dep] for dep in node.deps)
+        levels = [[] for _ in range(max(depth.values()) + 1)]
+        for key in self._nodes:
+            levels[depth[key]].append(key)
+        return levels
+
+    # Primitives
+
+    def column(self, name):
+        return self.add(('column', name), itemgetter(name), FRAME)
+
+    def ewm(self, series, window, min_periods=0):
+        def func(x):
+            return x.ewm(span=window, min_periods=min_periods,
+                         adjust=False).mean()
+        return self.add(('ewm', series, window, min_periods), func, series)
+
+    def rolling(self, series, how, window, min_periods=0):
+        def func(x):
+            return getattr(x.rolling(window=window, min_periods=min_periods,
+                                     center=False), how)()
+        return self.add(('rolling', how, series, window, min_periods), func,
+                        series)
+
+    def change(self, series):
+        def func(x):
+            change = x.diff()
+            change.iloc[0] = 0.0  # Set gain/loss of first day to zero
+            return change
+        return self.add(('change', series), func, series)
+
+    # Indicators
+
+    def _params(self, name, kwargs):
+        params = _defaults(getattr(indicators, name))
+        params.update(kwargs)
+        return params
+
+    def _indicator(self, name, kwargs):
+        func = getattr(indicators, name)
+        params = self._params(name, kwargs)
+        expand = self._expansions.get(name)
+        if name in SERIES_INDICATORS:
+            source = self.column(self.currency)
+        else:
+            source = FRAME
+        if expand is None:
+            return self.add(('opaque', name, _freeze(kwargs)),
+                            lambda x: func(x, **kwargs), source)
+        return expand(self, source, **params)
+
+    def _macd(self, series, fast_window, slow_window, signal_window):
+        fast = self.ewm(series, fast_window)
+        slow = self.ewm(series, slow_window)
+        line = self.add(('sub', fast, slow), sub, fast, slow)
+        signal = self.ewm(line, signal_window)
+
+        def func(macd, signal):
+            return pd.DataFrame({'macd_{}-{}'.format(fast_window, slow_window): macd,
+                                 'macd_signal_{}-{}'.format(fast_window, slow_window): signal})
+        return self.add(('macd', line, signal), func, line, signal)
+
+    def _rsi(self, series, window, min_periods):
+        change = self.change(series)
+        gain = self.add(('gain', change),
+                        lambda x: x.where(x > 0, other=0.0), change)
+        loss = self.add(('loss', change),
+                        lambda x: x.where(x < 0, other=0.0).abs(), change)
+        avg_up = self.rolling(gain, 'mean', window, min_periods)
+        avg_down = self.rolling(loss, 'mean', window, min_periods)
+
+        def func(avg_up, avg_down):
+            rsi = avg_up / (avg_up + avg_down) * 100
+            rsi = rsi.replace(to_replace=[np.inf, np.NaN], value=50)
+            if min_periods > 0:
+                rsi[:min_periods-1] = np.NaN
+            return rsi.to_frame('rsi_{}'.format(window))
+        return self.add(('rsi', window, min_periods, avg_up, avg_down), func,
+                        avg_up, avg_down)
+
+    def _bbands(self, series, window, min_periods, stdev_multiplier, mode):
+        middle = self.rolling(series, 'mean', window, min_periods)
+        std = self.rolling(series, 'std', window, min_periods)
+
+        def func(middle, std):
+            std = std * stdev_multiplier
+            std.iloc[0] = 0.0  # We define the std of one element to be 0
+            upper = middle + std
+            lower = middle - std
+            if mode=='ranges':
+                return pd.DataFrame({'bbands_lower_{}'.format(window): lower,
+                                     'bbands_middle_{}'.format(window): middle,
+                                     'bbands_upper_{}'.format(window): upper})
+            elif mode=='spread':
+                return pd.DataFrame({'bbands_{}'.format(window): (upper-lower)/middle})
+        return self.add(('bbands', window, stdev_multiplier, mode, middle, std),
+                        func, middle, std)
+
+    def _stoc(self, frame, col_labels, k_smooth, d_smooth, window,
+              min_periods=0):
+        low, high, close = [self.column(i) for i in col_labels]
+        lowest_low = self.rolling(low, 'min', window)
+        highest_high = self.rolling(high, 'max', window)
+
+        def func(close, lowest_low, highest_high):
+            k = (close - lowest_low) / (highest_high - lowest_low) * 100
+            if min_periods > 0:
+                k[:min_periods] = np.NaN
+            return k
+        k = self.add(('stoc_k', min_periods, close, lowest_low, highest_high),
+                     func, close, lowest_low, highest_high)
+        if k_smooth != 0:
+            k = self.rolling(k, 'mean', k_smooth)
+        d = self.rolling(k, 'mean', d_smooth)
+
+        def func(k, d):
+            return pd.DataFrame({'%K_{}'.format(window): k,
+                                 '%D_{}'.format(window): d})
+        return self.add(('stoc', window, k, d), func, k, d)
+
+    _expansions = {'macd': _macd, 'rsi': _rsi, 'bbands': _bbands,
+                   'stoc': _stoc, 'fstoc': _stoc, 'sstoc': _stoc}
+
+    def _needed(self, names):
+        needed = set()
+        stack = [self.outputs[name] for name in names]
+        while stack:
+            key = stack.pop()
+            if key != FRAME and key not in needed:
+                needed.add(key)
+                stack.extend(self._nodes[key].deps)
+        return needed
+
+    def evaluate(self, df, cache=None):
+        """Compute every indicator on ``df``, in the order of the config."""
+        if cache is None:
+            results = self._evaluate(df, self.outputs)
+        else:
+            results = self._cached(df, cache)
+        return OrderedDict((name, results[name]) for name in self.outputs)
+
+    def _cached(self, df, cache):
+        fingerprint = cache.fingerprint(df)
+        results, missing, overlaps = {}, [], {}
+        for name, key in self.keys.items():
+            value = cache.get(key, fingerprint)
+            if value is not None:
+                results[name] = value
+                continue
+            overlap = None
+            if self.lookbacks[name] is not None:
+                overlap = cache.overlap(key, fingerprint, self.lookbacks[name])
+            if overlap is None:
+                missing.append(name)
+            else:
+                overlaps[name] = overlap
+
+        if missing:
+            results.update(self._evaluate(df, missing))
+        if overlaps:
+            # One evaluation on the first rows needed by all the heads, one
+            # on the last rows needed by all the tails
+            head = max(start for start, _, _ in overlaps.values())
+            tail = min(stop - self.lookbacks[name]
+                       for name, (_, stop, _) in overlaps.items())
+            heads = self._evaluate(df.iloc[:head], overlaps) if head else {}
+            tails = self._evaluate(df.iloc[tail:], overlaps)
+            for name, (start, stop, values) in overlaps.items():
+                parts = [values, tails[name].iloc[stop - tail:]]
+                if start:
+                    parts.insert(0, heads[name].iloc[:start])
+                results[name] = pd.concat(parts)
+
+        for name in missing + list(overlaps):
+            cache.put(self.keys[name], fingerprint, results[name])
+        return results
+
+    def _evaluate(self, df, names):
+        needed = self._needed(names)
+        values = {FRAME: df}
+
+        def compute(key):
+            node = self._nodes[key]
+            with timer('indicator_seconds', node=self._labels[key]):
+                return node.func(*[values[dep] for dep in node.deps])
+
+        pool = ThreadPool(self.max_workers) if self.max_workers > 1 else None
+        try:
+            for level in self._levels:
+                level = [key for key in level if key in needed]
+                results = (pool.map if pool else map)(compute, level)
+                values.update(zip(level, results))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        return dict((name, values[self.outputs[name]]) for name in names)
@@ -108,13 +108,16 @@ def atr(df, col_labels=('low', 'high', 'close'), window=14):
 
     max_tr = pd.concat([tr_1, tr_2, tr_3], axis=1).max(axis=1)
 
-    atr = pd.Series(0.0, index=max_tr.index, name='ATR')
-    atr[:window-1] = np.NaN
-    atr[window-1] = max_tr[:window].mean()
-
-    for i in range(window, len(atr)):
-        atr[i] = (atr[i - 1] * (window - 1) + max_tr[i]) / window
-
+    # Wilder smoothing, atr[i] = (atr[i-1]*(window-1) + tr[i])/window, is an
+    # EWM with alpha=1/window seeded with the mean of the first window
+    values = np.full(len(max_tr), np.NaN)
+    if len(max_tr) >= window:
+        seeded = max_tr.values[window-1:].copy()
+        seeded[0] = max_tr[:window].mean()
+        values[window-1:] = pd.Series(seeded).ewm(alpha=1./window,
+                                                  adjust=False).mean().values
+
+    atr = pd.Series(values, index=max_tr.index, name='ATR')
     return atr.to_frame('atr_{}'.format(window))
 
 
@@ -157,63 +160,71 @@ def rsi(series, window=14, min_periods=0):
     return rsi.to_frame('rsi_{}'.format(window))
 
 
+PIVOT_PERIODS = {'day': pd.Timedelta(days=1), 'week': pd.Timedelta(weeks=1)}
+
+
+def period_start(index, mode='day'):
+    """Start of the day, or of the week (from Monday), of each timestamp."""
+    days = index.normalize()
+    if mode == 'week':
+        return days - pd.to_timedelta(index.dayofweek, unit='D')
+    return days
+
+
 def get_pivot(x, mode='day'):
     if mode=='day':
-        x[mode] = x.reset_index()['index'].apply(lambda x: x.dayofyear).values
         logging.info('Calculating daily pivot levels')
     if mode=='week':
-        x[mode] = x.reset_index()['index'].apply(lambda x: x.week).values
         logging.info('Calculating weekly pivot levels')
 
-    close = x.groupby([mode]).last()['value'].sort_index()
-    high = x.groupby([mode]).aggregate(np.max)['value'].sort_index()
-    low = x.groupby([mode]).aggregate(np.min)['value'].sort_index()
+    groups = x['value'].groupby(period_start(x.index, mode))
+    close = groups.last()
+    high = groups.max()
+    low = groups.min()
 
-    pivot = ((high+low+close)/3).to_frame('P')
+    pivot = (high+low+close)/3
+    r1 = 2*pivot - low
+    s1 = 2*pivot - high
+    r2 = pivot - s1 + r1
+    s2 = pivot - (r1 - s1)
+    r3 = pivot - s2 + r2
+    s3 = pivot - (r2 - s2)
 
-    r1 = (2*pivot['P'] - low).to_frame('R1')
-    s1 = (2*pivot['P'] - high).to_frame('S1')
-    r2 = (pivot['P'] - s1['S1'] + r1['R1']).to_frame('R2')
-    s2 = (pivot['P'] - (r1['R1'] - s1['S1'])).to_frame('S2')
-    r3 = (pivot['P'] - s2['S2'] + r2['R2']).to_frame('R3')
-    s3 = (pivot['P'] - (r2['R2'] - s2['S2'])).to_frame('S3')
-    
-    return reduce(lambda x,y: pd.concat([x,y], axis=1), [pivot, r1, s1, r2, s2, r3, s3] )
+    return pd.DataFrame({'P': pivot, 'R1': r1, 'S1': s1, 'R2': r2,
+                         'S2': s2, 'R3': r3, 'S3': s3},
+                        columns=['P', 'R1', 'S1', 'R2', 'S2', 'R3', 'S3'])
 
 
 def pivot(series, mode='day'):
     x = series.to_frame('value')
     p = get_pivot(x, mode)
-    if mode=='week':
-        x[mode] = x.reset_index()['index'].apply(lambda x: x.week).values
-    elif mode=='day':
-        x[mode] = x.reset_index()['index'].apply(lambda x: x.dayofyear).values
+    # Levels of the period before the one of each row, NaN if it has no data
+    previous = p.reindex(period_start(x.index, mode) - PIVOT_PERIODS[mode])
+    levels = ['{}_{}_diff'.format(i, mode) for i in p.columns]
 
-    groups = x.groupby([mode])
-    out = pd.DataFrame()
-    levels = ['{}_{}_diff'.format(i, mode) for i in p.columns ]
+    return pd.DataFrame(series.values[:, None] - previous.values,
+                        index=series.index, columns=levels)
 
-    for igroup, group in groups:
-        ref = igroup-1
-        for i in levels:
-            if ref in p.index:
-                group.loc[:,i] = group.loc[:,'value'] - p.loc[ref, i.split('_')[:1]].values[0]
-            else:    
-                group.loc[:,i] =  np.nan
 
-        out = pd.concat([out, group])
-        
-    return out[levels]
+def run_lengths(mask):
+    """Length of the run of True values ending at each position (along the
+    first axis)."""
+    idx = np.arange(len(mask)).reshape((-1,) + (1,) * (mask.ndim - 1))
+    last_false = np.maximum.accumulate(np.where(mask, -1, idx), axis=0)
+    return np.where(mask, idx - last_false, 0)
 
 
 def consecutive(series):
-    series_up = (series - series.shift(1)).copy()
-    series_down = (series.shift(1) - series).copy()
-    y_up = series_up.apply(lambda x: 1 if x>0 else 0)
-    y_up = (y_up * (y_up.groupby((y_up != y_up.shift()).cumsum()).cumcount() + 1)).to_frame('conseq_up')
-    y_down = series_down.apply(lambda x: 1 if x>0 else 0)
-    y_down = (y_down * (y_down.groupby((y_down != y_down.shift()).cumsum()).cumcount() + 1)).to_frame('conseq_down')
-    return y_up.join(y_down)
+    change = np.diff(series.values)
+    up = np.zeros(len(series), dtype=bool)
+    down = np.zeros(len(series), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        up[1:] = change > 0
+        down[1:] = change < 0
+    return pd.DataFrame({'conseq_up': run_lengths(up),
+                         'conseq_down': run_lengths(down)},
+                        index=series.index,
+                        columns=['conseq_up', 'conseq_down'])
 
 
 def consecutive_periods(series, add_periods):
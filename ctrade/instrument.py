@@ -0,0 +1,306 @@
+"""Low overhead timers, counters and spans for the trading pipeline.
+
+Stages are timed into histograms kept by a ``Metrics`` registry:
+
+    with timer('stage_seconds', stage='fetch'):
+        ...
+
+    @timed('stage_seconds', stage='predict')
+    def predict(...):
+        ...
+
+A ``span`` is a timer that also sends an event to the exporters, e.g. a
+``JsonLinesExporter``. ``PrometheusExporter`` serves the histograms and
+counters in the Prometheus text format on a local port. Set
+``metrics.enabled = False``, or CTRADE_METRICS=0 in the environment, to turn
+everything into no-ops.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+from six.moves import BaseHTTPServer, socketserver
+
+__all__ = ['Metrics', 'metrics', 'JsonLinesExporter', 'PrometheusExporter']
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+           5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=BUCKETS):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+
+class Counter(object):
+
+    def __init__(self):
+
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, metrics, name, labels, emit=False):
+
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.emit = emit
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.time() - self.start
+        self.metrics.observe(self.name, self.elapsed, **self.labels)
+        if self.emit:
+            event = {'span': self.name, 'start': self.start,
+                     'seconds': self.elapsed}
+            event.update(self.labels)
+            if exc_type is not None:
+                event['error'] = exc_type.__name__
+            self.metrics.emit(event)
+        return False
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, '{}'.format(v)) for k, v in labels.items()))
+
+
+class Metrics(object):
+    """Registry of histograms and counters, keyed by name and labels."""
+
+    def __init__(self, enabled=True, buckets=BUCKETS):
+
+        self.enabled = enabled
+        self.buckets = buckets
+        self.exporters = []
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = _key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def counter(self, name, **labels):
+        key = _key(name, labels)
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter())
+        return counter
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self.histogram(name, **labels).observe(value)
+
+    def inc(self, name, n=1, **labels):
+        if self.enabled:
+            self.counter(name, **labels).inc(n)
+
+    def timer(self, name, **labels):
+        """Context manager timing its block into the histogram ``name``."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def span(self, name, **labels):
+        """Like ``timer``, also sending an event to the exporters."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels, emit=True)
+
+    def timed(self, name, **labels):
+        """Decorator timing every call of the function."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self, name, labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def emit(self, event):
+        for exporter in self.exporters:
+            exporter.export(event)
+
+    def snapshot(self):
+        """The current values, as a list of dicts."""
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        out = []
+        for (name, labels), h in sorted(histograms):
+            out.append({'name': name, 'labels': dict(labels), 'type': 'histogram',
+                        'count': h.count, 'sum': h.sum,
+                        'buckets': list(zip(h.buckets, h.counts))})
+        for (name, labels), c in sorted(counters):
+            out.append({'name': name, 'labels': dict(labels), 'type': 'counter',
+                        'value': c.value})
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+metrics = Metrics(enabled=os.environ.get('CTRADE_METRICS', '1') != '0')
+timer = metrics.timer
+span = metrics.span
+timed = metrics.timed
+inc = metrics.inc
+
+
+class JsonLinesExporter(object):
+    """Write span events, and snapshots on ``flush``, as JSON lines."""
+
+    def __init__(self, path, metrics=metrics):
+
+        self.path = path
+        self.metrics = metrics
+        self._lock = threading.Lock()
+
+    def _write(self, objects):
+        lines = ''.join(json.dumps(obj, sort_keys=True) + '\n' for obj in objects)
+        with self._lock:
+            with io.open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    def export(self, event):
+        self._write([event])
+
+    def flush(self):
+        now = time.time()
+        self._write(dict(metric, time=now) for metric in self.metrics.snapshot())
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, '{}'.format(v).replace('"', '\\"'))
+                          for k, v in sorted(labels.items())) + '}'
+
+
+def prometheus_text(metrics, prefix='ctrade_'):
+    """Render the metrics in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+    for metric in metrics.snapshot():
+        name = prefix + metric['name']
+        if name not in typed:
+            lines.append('# TYPE {} {}'.format(name, metric['type']))
+            typed.add(name)
+        labels = metric['labels']
+        if metric['type'] == 'counter':
+            lines.append('{}{} {}'.format(name, _labels(labels), metric['value']))
+            continue
+        cumulative = 0
+        for bound, count in metric['buckets']:
+            cumulative += count
+            lines.append('{}_bucket{} {}'.format(name, _labels(labels, le=bound),
+                                                 cumulative))
+        lines.append('{}_bucket{} {}'.format(name, _labels(labels, le='+Inf'),
+                                             metric['count']))
+        lines.append('{}_sum{} {}'.format(name, _labels(labels), metric['sum']))
+        lines.append('{}_count{} {}'.format(name, _labels(labels), metric['count']))
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = prometheus_text(self.server.metrics).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _MetricsServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PrometheusExporter(object):
+    """Serve the metrics to Prometheus on ``host``:``port``."""
+
+    def __init__(self, port=9108, host='127.0.0.1', metrics=metrics):
+
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self._server = None
+
+    def start(self):
+        self._server = _MetricsServer((self.host, self.port), _MetricsHandler)
+        self._server.metrics = self.metrics
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def export(self, event):
+        # Scraped, the events are already in the histograms
+        pass
@@ -0,0 +1,47 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import fcntl
+import threading
+import time
+
+__all__ = ['NonceManager']
+
+
+class NonceManager(object):
+    """Monotonic nonces shared by all the threads and processes using a key.
+
+    The last nonce handed out is kept in ``path``. Allocation holds a thread
+    lock and an exclusive lock on the file, so two callers never get the
+    same nonce and nonces keep growing across restarts, even if the clock
+    goes back.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._lock = threading.Lock()
+
+    def last(self):
+        if not os.path.isfile(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            data = f.read().strip()
+        return int(data) if data else 0
+
+    def next(self):
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.read(fd, 32).strip()
+                last = int(data) if data else 0
+                nonce = max(int(time.time() * 1000), last + 1)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, str(nonce).encode('ascii'))
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        return nonce
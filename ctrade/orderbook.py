@@ -0,0 +1,223 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['OrderBook', 'book_features']
+
+SIDES = ('bids', 'asks')
+
+
+class BookSide(object):
+    """Price levels of one side of the book in sorted arrays.
+
+    Levels are kept sorted best first. Bids are stored with negated prices so
+    that both sides sort ascending and share the same ``searchsorted``
+    lookups. The cumulative sizes are rebuilt lazily after an update.
+    """
+
+    def __init__(self, sign, prices=(), sizes=()):
+
+        self.sign = sign
+        self.keys = np.empty(0)
+        self.sizes = np.empty(0)
+        self._cumsum = None
+        self.merge(prices, sizes)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def prices(self):
+        return self.keys * self.sign
+
+    @property
+    def cumsum(self):
+        if self._cumsum is None:
+            self._cumsum = np.cumsum(self.sizes)
+        return self._cumsum
+
+    def best(self):
+        if not len(self.keys):
+            return np.nan, 0.0
+        return self.keys[0] * self.sign, self.sizes[0]
+
+    def set(self, price, size):
+        """Set the size at ``price``, removing the level if ``size`` is 0."""
+        key = price * self.sign
+        i = np.searchsorted(self.keys, key)
+        exists = i < len(self.keys) and self.keys[i] == key
+        if exists and size == 0:
+            self.keys = np.delete(self.keys, i)
+            self.sizes = np.delete(self.sizes, i)
+        elif exists:
+            self.sizes[i] = size
+        elif size != 0:
+            self.keys = np.insert(self.keys, i, key)
+            self.sizes = np.insert(self.sizes, i, size)
+        self._cumsum = None
+
+    def merge(self, prices, sizes):
+        """Apply a batch of levels, later ones overriding earlier ones."""
+        prices = np.asarray(prices, dtype=np.float64)
+        if not len(prices):
+            return
+        keys = np.concatenate([self.keys, prices * self.sign])
+        sizes = np.concatenate([self.sizes, np.asarray(sizes, dtype=np.float64)])
+        order = np.argsort(keys, kind='mergesort')
+        keys, sizes = keys[order], sizes[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        keep = last & (sizes != 0)
+        self.keys, self.sizes = keys[keep], sizes[keep]
+        self._cumsum = None
+
+    def depth_at(self, price):
+        key = price * self.sign
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.sizes[i]
+        return 0.0
+
+    def cumulative_depth(self, price):
+        i = np.searchsorted(self.keys, price * self.sign, side='right')
+        return self.cumsum[i - 1] if i else 0.0
+
+    def volume(self, levels):
+        return self.cumsum[min(levels, len(self)) - 1] if len(self) else 0.0
+
+
+class OrderBook(object):
+    """L2 order book of one pair.
+
+    Load it from a ``returnOrderBook`` reply with ``from_snapshot`` and keep
+    it current with ``update``/``apply``. The best levels are read in O(1),
+    depth queries are binary searches.
+    """
+
+    def __init__(self, pair, bids=None, asks=None, seq=None):
+
+        self.pair = pair
+        self.seq = seq
+        bids = np.empty((0, 2)) if bids is None else np.asarray(bids, dtype=np.float64)
+        asks = np.empty((0, 2)) if asks is None else np.asarray(asks, dtype=np.float64)
+        self.bids = BookSide(-1, bids[:, 0], bids[:, 1])
+        self.asks = BookSide(1, asks[:, 0], asks[:, 1])
+
+    def __repr__(self):
+        return '{} - bid {} - ask {} - {}x{} levels'.format(self.pair,
+                                                            self.best_bid,
+                                                            self.best_ask,
+                                                            len(self.bids),
+                                                            len(self.asks))
+
+    @classmethod
+    def from_snapshot(cls, pair, reply):
+        def levels(side):
+            return np.array(reply[side], dtype=np.float64).reshape(-1, 2)
+        return cls(pair, levels('bids'), levels('asks'), reply.get('seq'))
+
+    def _side(self, side):
+        if side not in SIDES:
+            raise ValueError("side must be one of {}".format(SIDES))
+        return getattr(self, side)
+
+    def update(self, side, price, size, seq=None):
+        """Set one level; a size of 0 removes it."""
+        if seq is not None:
+            if self.seq is not None and seq <= self.seq:
+                return False
+            self.seq = seq
+        self._side(side).set(float(price), float(size))
+        return True
+
+    def apply(self, updates, seq=None):
+        """Apply a batch of (side, price, size) updates in one merge per side."""
+        if seq is not None:
+            if self.seq is not None and seq <= self.seq:
+                return False
+            self.seq = seq
+        updates = list(updates)
+        for side in SIDES:
+            levels = [(price, size) for _side, price, size in updates if _side == side]
+            if levels:
+                levels = np.array(levels, dtype=np.float64)
+                self._side(side).merge(levels[:, 0], levels[:, 1])
+        return True
+
+    @property
+    def best_bid(self):
+        return self.bids.best()[0]
+
+    @property
+    def best_ask(self):
+        return self.asks.best()[0]
+
+    @property
+    def mid(self):
+        return (self.best_bid + self.best_ask) / 2
+
+    @property
+    def spread(self):
+        return self.best_ask - self.best_bid
+
+    def depth_at(self, side, price):
+        return self._side(side).depth_at(price)
+
+    def cumulative_depth(self, side, price):
+        """Size available at ``price`` or better on ``side``."""
+        return self._side(side).cumulative_depth(price)
+
+    def imbalance(self, levels=5):
+        bid = self.bids.volume(levels)
+        ask = self.asks.volume(levels)
+        total = bid + ask
+        return (bid - ask) / total if total else np.nan
+
+    def microprice(self):
+        bid, bid_size = self.bids.best()
+        ask, ask_size = self.asks.best()
+        total = bid_size + ask_size
+        return (bid * ask_size + ask * bid_size) / total if total else np.nan
+
+    def features(self, levels=5):
+        return pd.Series([self.best_bid, self.best_ask, self.mid, self.spread,
+                          self.spread / self.mid, self.imbalance(levels),
+                          self.microprice()],
+                         index=['bid', 'ask', 'mid', 'spread', 'rel_spread',
+                                'imbalance', 'microprice'],
+                         name=self.pair)
+
+
+def book_features(books, levels=5):
+    """Top of book features of several books, one row per pair.
+
+    The top ``levels`` of every book are stacked in two matrices so that the
+    features of all the pairs are computed with a few array operations.
+    """
+    books = list(books)
+    shape = (len(books), levels)
+    bid_px, ask_px = np.full(shape, np.nan), np.full(shape, np.nan)
+    bid_sz, ask_sz = np.zeros(shape), np.zeros(shape)
+    for i, book in enumerate(books):
+        n = min(levels, len(book.bids))
+        bid_px[i, :n], bid_sz[i, :n] = book.bids.prices[:n], book.bids.sizes[:n]
+        n = min(levels, len(book.asks))
+        ask_px[i, :n], ask_sz[i, :n] = book.asks.prices[:n], book.asks.sizes[:n]
+
+    bid, ask = bid_px[:, 0], ask_px[:, 0]
+    mid = (bid + ask) / 2
+    bid_vol, ask_vol = bid_sz.sum(axis=1), ask_sz.sum(axis=1)
+    top = bid_sz[:, 0] + ask_sz[:, 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = pd.DataFrame({'bid': bid,
+                            'ask': ask,
+                            'mid': mid,
+                            'spread': ask - bid,
+                            'rel_spread': (ask - bid) / mid,
+                            'imbalance': (bid_vol - ask_vol) / (bid_vol + ask_vol),
+                            'microprice': (bid * ask_sz[:, 0] + ask * bid_sz[:, 0]) / top},
+                           index=[book.pair for book in books],
+                           columns=['bid', 'ask', 'mid', 'spread', 'rel_spread',
+                                    'imbalance', 'microprice'])
+    return out
@@ -0,0 +1,221 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from .indicators import run_lengths, period_start, PIVOT_PERIODS
+
+__all__ = ['panel_fields', 'panel_sma', 'panel_ema', 'panel_macd',
+           'panel_rsi', 'panel_bbands', 'panel_stoc', 'panel_atr',
+           'panel_pivot', 'panel_consecutive']
+
+# The indicators of this module take panels, frames with one row per date and
+# one column per pair such as ``ChartBatch.panel('close')``, and compute all
+# the pairs at once. Column j of the output is the output of the single pair
+# indicator on column j of the input, gaps (NaN) included. Indicators with
+# several outputs return (pair, label) columns, like ``ChartBatch.panel()``.
+
+
+def panel_fields(batch, fields=('low', 'high', 'close')):
+    """Aligned panels of ``fields`` from a ``ChartBatch``."""
+    panel = batch.panel()
+    return tuple(panel.xs(field, axis=1, level=1) for field in fields)
+
+
+def _like(panel, values):
+    return pd.DataFrame(values, index=panel.index, columns=panel.columns)
+
+
+def _stack(panel, outputs):
+    """One frame with (pair, label) columns from the arrays ``outputs``."""
+    values = np.empty(panel.shape + (len(outputs),))
+    for i, output in enumerate(outputs.values()):
+        values[:, :, i] = output
+    columns = pd.MultiIndex.from_product([panel.columns, list(outputs)])
+    return pd.DataFrame(values.reshape(len(panel), -1), index=panel.index,
+                        columns=columns)
+
+
+def _window_sum(cumsum, window):
+    out = cumsum.copy()
+    out[window:] -= cumsum[:-window]
+    return out
+
+
+def _rolling_moments(x, window):
+    """Count and sum of the finite values of each window.
+
+    Infinite values are left out like NaN, as pandas ``rolling`` does, so
+    they cannot poison the cumulative sums past their window. The values
+    are shifted by the first value of their column before the cumulative
+    sums to limit the loss of precision of the differences.
+    """
+    valid = np.isfinite(x)
+    first = np.where(valid.any(axis=0), x[valid.argmax(axis=0), np.arange(x.shape[1])], 0.)
+    y = np.where(valid, x - first, 0.)
+    count = _window_sum(np.cumsum(valid, axis=0), window)
+    total = _window_sum(np.cumsum(y, axis=0), window)
+    return count, total, first
+
+
+def _rolling_mean(x, window, min_periods=0):
+    count, total, first = _rolling_moments(x, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count + first
+    return np.where(count >= max(min_periods, 1), mean, np.NaN)
+
+
+def _rolling_std(x, window, min_periods=0):
+    # Not from cumulative sums of squares, whose differences cancel out:
+    # pandas centres every window, all the columns in one call
+    return pd.DataFrame(x).rolling(window=window, min_periods=min_periods).std().values
+
+
+def _rolling_extreme(x, window, accumulate):
+    """Rolling max or min ignoring NaN, ``accumulate`` being np.fmax or
+    np.fmin, with van Herk/Gil-Werman blocks: three passes whatever the
+    window."""
+    n, m = x.shape
+    blocks = -(-n // window)
+    padded = np.full((blocks * window, m), np.NaN)
+    padded[:n] = x
+    padded = padded.reshape(blocks, window, m)
+    prefix = accumulate.accumulate(padded, axis=1).reshape(-1, m)[:n]
+    suffix = accumulate.accumulate(padded[:, ::-1], axis=1)[:, ::-1].reshape(-1, m)
+    out = prefix.copy()
+    if n >= window:
+        out[window-1:] = accumulate(suffix[:n-window+1], prefix[window-1:])
+    return out
+
+
+def _ewm(x, window, min_periods=0):
+    return pd.DataFrame(x).ewm(span=window, min_periods=min_periods,
+                               adjust=False).mean().values
+
+
+def panel_sma(panel, window=50, min_periods=0):
+    return _like(panel, _rolling_mean(panel.values.astype(np.float64),
+                                      window, min_periods))
+
+
+def panel_ema(panel, window=50, min_periods=0):
+    return _like(panel, _ewm(panel.values, window, min_periods))
+
+
+def panel_macd(panel, fast_window=12, slow_window=26, signal_window=9):
+    x = panel.values
+    macd = _ewm(x, fast_window) - _ewm(x, slow_window)
+    signal = _ewm(macd, signal_window)
+    return _stack(panel, OrderedDict([
+        ('macd_{}-{}'.format(fast_window, slow_window), macd),
+        ('macd_signal_{}-{}'.format(fast_window, slow_window), signal)]))
+
+
+def panel_rsi(panel, window=14, min_periods=0):
+    x = panel.values.astype(np.float64)
+    change = np.zeros_like(x)
+    change[1:] = x[1:] - x[:-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        up = np.where(change > 0, change, 0.)
+        down = np.where(change < 0, -change, 0.)
+        avg_up = _rolling_mean(up, window, min_periods)
+        avg_down = _rolling_mean(down, window, min_periods)
+        rsi = avg_up / (avg_up + avg_down) * 100
+    rsi[~np.isfinite(rsi)] = 50
+    if min_periods > 0:
+        rsi[:min_periods-1] = np.NaN
+    return _like(panel, rsi)
+
+
+def panel_bbands(panel, window=20, min_periods=0, stdev_multiplier=2,
+                 mode='ranges'):
+    x = panel.values.astype(np.float64)
+    middle = _rolling_mean(x, window, min_periods)
+    std = _rolling_std(x, window, min_periods) * stdev_multiplier
+    std[0] = 0.0  # We define the std of one element to be 0
+    upper = middle + std
+    lower = middle - std
+    if mode=='ranges':
+        return _stack(panel, OrderedDict([
+            ('bbands_lower_{}'.format(window), lower),
+            ('bbands_middle_{}'.format(window), middle),
+            ('bbands_upper_{}'.format(window), upper)]))
+    elif mode=='spread':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return _like(panel, (upper-lower)/middle)
+
+
+def panel_stoc(low, high, close, k_smooth=0, d_smooth=3, window=14,
+               min_periods=0):
+    lowest_low = _rolling_extreme(low.values.astype(np.float64), window, np.fmin)
+    highest_high = _rolling_extreme(high.values.astype(np.float64), window, np.fmax)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        k = (close.values - lowest_low) / (highest_high - lowest_low) * 100
+
+    if min_periods > 0:
+        k[:min_periods] = np.NaN
+
+    if k_smooth != 0:
+        k = _rolling_mean(k, k_smooth)
+    d = _rolling_mean(k, d_smooth)
+
+    return _stack(close, OrderedDict([('%D_{}'.format(window), d),
+                                      ('%K_{}'.format(window), k)]))
+
+
+def panel_atr(low, high, close, window=14):
+    panel = close
+    low, high, close = [i.values.astype(np.float64) for i in (low, high, close)]
+    previous = np.full_like(close, np.NaN)
+    previous[1:] = close[:-1]
+    true_range = np.fmax(np.fmax(high - low, np.abs(high - previous)),
+                         np.abs(low - previous))
+
+    # Wilder smoothing seeded with the mean of the first window, as in atr
+    values = np.full_like(true_range, np.NaN)
+    if len(true_range) >= window:
+        seeded = true_range[window-1:].copy()
+        first = true_range[:window]
+        valid = ~np.isnan(first)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            seeded[0] = np.where(valid, first, 0.).sum(axis=0) / valid.sum(axis=0)
+        values[window-1:] = pd.DataFrame(seeded).ewm(alpha=1./window,
+                                                     adjust=False).mean().values
+    return _like(panel, values)
+
+
+def panel_pivot(panel, mode='day'):
+    keys = period_start(panel.index, mode)
+    groups = panel.groupby(keys)
+    close = groups.last()
+    high = groups.max()
+    low = groups.min()
+
+    pivot = (high+low+close)/3
+    r1 = 2*pivot - low
+    s1 = 2*pivot - high
+    r2 = pivot - s1 + r1
+    s2 = pivot - (r1 - s1)
+    r3 = pivot - s2 + r2
+    s3 = pivot - (r2 - s2)
+
+    previous = keys - PIVOT_PERIODS[mode]
+    levels = OrderedDict()
+    for level, values in zip(['P', 'R1', 'S1', 'R2', 'S2', 'R3', 'S3'],
+                             [pivot, r1, s1, r2, s2, r3, s3]):
+        levels['{}_{}_diff'.format(level, mode)] = (panel.values -
+                                                    values.reindex(previous).values)
+    return _stack(panel, levels)
+
+
+def panel_consecutive(panel):
+    x = panel.values.astype(np.float64)
+    up = np.zeros(x.shape, dtype=bool)
+    down = np.zeros(x.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        up[1:] = x[1:] > x[:-1]
+        down[1:] = x[1:] < x[:-1]
+    return _stack(panel, OrderedDict([('conseq_up', run_lengths(up)),
+                                      ('conseq_down', run_lengths(down))]))
@@ -4,33 +4,109 @@ from __future__ import (absolute_import, division, print_function,
 from .utils import *
 from .exceptions import *
 from .manager import *
-
-import urllib2, urllib
+from .store import to_records, to_frame
+from .ratelimit import *
+from .decode import CandleDecoder
+from .cache import SnapshotCache
+from .orderbook import OrderBook
+from .nonce import NonceManager
+from .stub import StubExchange
+from .instrument import timer, timed, inc
+
+import os
+import urllib
 import time
 import json
 import hmac
 import hashlib
 import logging
+import threading
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+import numpy as np
 import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-__all__ = ['Poloniex']
+__all__ = ['Poloniex', 'ChartBatch', 'OrderResult']
+
+# Upper bound on the queries in flight at once, shared by every client
+MAX_CONCURRENCY = 6
+# Poloniex bans clients making more than 6 calls per second
+REQUESTS_PER_SECOND = 6
+# Bytes read at a time when streaming a reply
+CHUNK_SIZE = 2 ** 16
+
+
+ORDER_SIDES = ('buy', 'sell', 'margin_buy', 'margin_sell')
+
+# Commands that must not run twice. A timeout or a server error may come
+# after the exchange executed them, so they are only retried on failures
+# known to happen before the request was processed.
+UNSAFE_COMMANDS = frozenset(['buy', 'sell', 'marginBuy', 'marginSell',
+                             'closeMarginPosition', 'cancelOrder', 'moveOrder',
+                             'withdraw', 'transferBalance', 'createLoanOffer',
+                             'cancelLoanOffer'])
+
+# Outcome of one order of a batch, latency in seconds
+OrderResult = namedtuple('OrderResult', ['order', 'reply', 'error', 'latency'])
 
 
 def createTimeStamp(datestr, format="%Y-%m-%d %H:%M:%S"):
     return time.mktime(time.strptime(datestr, format))
 
 
+def _unsent(error):
+    """Whether a requests error happened before the request was sent."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0] if error.args else None, 'reason', None)
+    return isinstance(reason, NewConnectionError)
+
+
+def create_session(pool_size=10, gzip=True):
+    """Create a keep-alive HTTP session.
+
+    Connections are pooled per host so that consecutive queries reuse the
+    same TCP/TLS connection instead of paying a new handshake each time.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate' if gzip else 'identity'
+    return session
+
+
 class Poloniex(object):
 
-    def __init__(self):
+    _slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+    _bucket = TokenBucket(REQUESTS_PER_SECOND)
+    _budget = RetryBudget()
+    _snapshots = SnapshotCache()
 
-        self.credentials = Credentials('poloniex')
-        self.credentials.load()
+    def __init__(self, credentials=None, pool_size=10, timeout=30, gzip=True,
+                 max_retries=5, snapshot_ttl=10, signed_workers=4):
+
+        if credentials is None:
+            credentials = Credentials('poloniex')
+            credentials.load()
+        self.credentials = credentials
         self.currency_pairs = CURRENCY_PAIRS
         self._periods = PERIODS2SEC
+        self.timeout = timeout
+        self.session = create_session(pool_size=pool_size, gzip=gzip)
+        self.backoff = Backoff(max_retries=max_retries)
+        self.snapshot_ttl = snapshot_ttl
+        self.signed_workers = signed_workers
+        self._signed = None
+        key = hashlib.sha1((self.apikey or '').encode('utf-8')).hexdigest()[:12]
+        self.nonces = NonceManager(os.path.join(self.credentials._credential_dir,
+                                                'poloniex-{}.nonce'.format(key)))
 
     def __getattr__(self, item):
         if hasattr(self.credentials, item):
@@ -67,30 +143,100 @@ class Poloniex(object):
     def periods(self):
         return self._periods.keys()
 
-    def ticker(self):
-        return self.pub_api_query({'command': 'returnTicker'})
+    def _snapshot(self, command, refresh=False):
+        """Reply of a public command, cached for ``snapshot_ttl`` seconds."""
+        key = (self.pub_api, command)
+        if refresh:
+            self._snapshots.invalidate(key)
+        return self._snapshots.get(key,
+                                   lambda: self.pub_api_query({'command': command}),
+                                   ttl=self.snapshot_ttl)
+
+    def invalidate(self):
+        """Drop the cached ticker and volume snapshots."""
+        for command in ['returnTicker', 'return24Volume']:
+            self._snapshots.invalidate((self.pub_api, command))
+
+    def ticker(self, refresh=False):
+        return self._snapshot('returnTicker', refresh=refresh)
 
-    def volume(self):
-        return self.pub_api_query({'command': 'return24Volume'})
+    def volume(self, refresh=False):
+        return self._snapshot('return24Volume', refresh=refresh)
 
-    def orderbook(self, pair):
+    def orderbook(self, pair, depth=None):
         if pair != 'all':
             pair = self._is_valid_pair(pair)
-        return self.pub_api_query({'command': 'returnOrderBook',
-                                   'currencyPair': pair})
-
-    def chart(self, pair, days_back=0, period='5m'):
+        commands = {'command': 'returnOrderBook',
+                    'currencyPair': pair}
+        if depth is not None:
+            commands['depth'] = depth
+        return self.pub_api_query(commands)
+
+    def book(self, pair, depth=None):
+        """Order book snapshot as an ``OrderBook`` (a dict of them for 'all')."""
+        reply = self.orderbook(pair, depth=depth)
+        if pair == 'all':
+            return {k: OrderBook.from_snapshot(k, v) for k, v in reply.items()}
+        return OrderBook.from_snapshot(pair, reply)
+
+    def chart(self, pair, days_back=0, period='5m', start=None, end=None,
+              stream=False):
+        """Candles of ``pair`` from ``days_back`` days ago (or ``start``).
+
+        With ``stream`` the reply is decoded while it downloads into a
+        record array, which keeps long backfills from holding the whole
+        body and a list of dicts in memory.
+        """
         pair = self._is_valid_pair(pair)
         period = self._is_valid_period(period)
-        start, end = get_start_end(days_back)
-        chart =  self.trading_api_query({'command': 'returnChartData',
-                                         'currencyPair': pair,
-                                         'period': period,
-                                         'start': start,
-                                         'end': end})
+        _start, _end = get_start_end(days_back)
+        start = _start if start is None else int(start)
+        end = _end if end is None else int(end)
+        commands = {'command': 'returnChartData',
+                    'currencyPair': pair,
+                    'period': period,
+                    'start': start,
+                    'end': end}
+        if stream:
+            size_hint = (end - start) // period + 1
+            chart = {'candleStick': self.trading_api_query(
+                commands, parse=self._candle_parser(size_hint))}
+        else:
+            chart = self.trading_api_query(commands)
 
         return Chart(pair, chart, start, end, period)
 
+    def charts(self, pairs, days_back=0, period='5m', max_workers=None):
+        """Fetch the charts of several pairs concurrently.
+
+        A pair that fails does not abort the batch: its exception is
+        stored in ``ChartBatch.errors`` instead.
+        """
+        pairs = [self._is_valid_pair(pair) for pair in pairs]
+        self._is_valid_period(period)
+
+        def fetch(pair):
+            try:
+                return pair, self.chart(pair, days_back, period), None
+            except Exception as e:
+                return pair, None, e
+
+        pool = ThreadPool(min(max_workers or MAX_CONCURRENCY, len(pairs)) or 1)
+        try:
+            results = pool.map(fetch, pairs)
+        finally:
+            pool.close()
+            pool.join()
+
+        batch = ChartBatch()
+        for pair, chart, error in results:
+            if error is None:
+                batch[pair] = chart
+            else:
+                logger.warning("Failed to fetch '{}' chart: {!r}".format(pair, error))
+                batch.errors[pair] = error
+        return batch
+
     def balance(self):
         return self.trading_api_query({'command': 'returnBalances'})
 
@@ -112,6 +258,42 @@ class Poloniex(object):
                                        'start': start,
                                        'end': end})
 
+    def iter_trading_history(self, pair, days_back=0, page_days=7, start=None,
+                             end=None, limit=10000, path=None):
+        """Yield the trades of ``pair`` one page at a time, oldest first.
+
+        The range is split in pages of ``page_days`` days, and a page that
+        hits ``limit`` trades is split again. Each page comes out as a typed
+        frame indexed by trade date, and is appended to the CSV file
+        ``path`` if one is given, so long ranges run in constant memory.
+        """
+        if pair != 'all':
+            pair = self._is_valid_pair(pair)
+        _start, _end = get_start_end(days_back)
+        start = _start if start is None else int(start)
+        end = _end if end is None else int(end)
+
+        step = int(page_days * 86400)
+        pages = [(t, min(t + step - 1, end)) for t in range(start, end + 1, step)]
+        pages.reverse()
+        while pages:
+            page_start, page_end = pages.pop()
+            reply = self.trading_api_query({'command': 'returnTradeHistory',
+                                            'currencyPair': pair,
+                                            'start': page_start,
+                                            'end': page_end,
+                                            'limit': limit})
+            trades = trades_frame(reply, pair)
+            if len(trades) >= limit and page_end > page_start:
+                middle = (page_start + page_end) // 2
+                pages += [(middle + 1, page_end), (page_start, middle)]
+                continue
+            if not len(trades):
+                continue
+            if path is not None:
+                trades.to_csv(path, mode='a', header=not os.path.isfile(path))
+            yield trades
+
     def open_orders(self, pair):
         if pair != 'all':
             pair = self._is_valid_pair(pair)
@@ -158,7 +340,7 @@ class Poloniex(object):
                                        'orderNumber': order_number})
 
     def withdraw(self, currency, amount, address):
-        return self.trading_api_query({'command': 'cancelOrder',
+        return self.trading_api_query({'command': 'withdraw',
                                        'currency': currency,
                                        'amount': amount,
                                        'address': address})
@@ -176,39 +358,258 @@ class Poloniex(object):
         return after
 
 
-    def pub_api_query(self, commands):
+    def close(self):
+        if self._signed is not None:
+            self._signed.close()
+            self._signed.join()
+            self._signed = None
+        self.session.close()
+
+    def _signed_queue(self):
+        if self._signed is None:
+            self._signed = ThreadPool(self.signed_workers)
+        return self._signed
+
+    def submit(self, method, *args, **kwargs):
+        """Run a client method, e.g. 'buy' or 'cancel', on the signed queue.
+
+        Up to ``signed_workers`` calls are in flight at once and each one
+        gets its nonce when it is sent. Returns an ``AsyncResult``.
+        """
+        return self._signed_queue().apply_async(getattr(self, method), args, kwargs)
+
+    def _batch(self, calls):
+
+        def timed(call):
+            method, args, order = call
+            t = time.time()
+            try:
+                reply, error = getattr(self, method)(*args), None
+            except Exception as e:
+                reply, error = None, e
+            return OrderResult(order, reply, error, time.time() - t)
+
+        return self._signed_queue().map(timed, calls)
+
+    def place_orders(self, orders, dry_run=False):
+        """Place several orders concurrently, within the rate limit.
+
+        ``orders`` are dicts with 'pair', 'side' ('buy', 'sell',
+        'margin_buy' or 'margin_sell'), 'rate' and 'amount'. Returns one
+        ``OrderResult`` per order, in the same order. A failed order
+        carries its exception instead of failing the batch. With
+        ``dry_run`` the orders go to a local ``StubExchange`` instead.
+        """
+        if dry_run:
+            return self._dry_run('place_orders', orders)
+        calls = []
+        for order in orders:
+            if order.get('side') not in ORDER_SIDES:
+                raise ValueError("side must be one of {}".format(ORDER_SIDES))
+            calls.append((order['side'],
+                          (order['pair'], order['rate'], order['amount']),
+                          order))
+        return self._batch(calls)
+
+    def cancel_orders(self, orders, dry_run=False):
+        """Cancel several orders, given as (pair, order_number), concurrently."""
+        if dry_run:
+            return self._dry_run('cancel_orders', orders)
+        return self._batch([('cancel', tuple(order), order) for order in orders])
+
+    def _dry_run(self, method, orders):
+        with StubExchange() as stub:
+            if method == 'cancel_orders':
+                # The stub only knows the orders being cancelled
+                stub.add_orders(orders)
+            client = stub.client(signed_workers=self.signed_workers)
+            try:
+                return getattr(client, method)(orders)
+            finally:
+                client.close()
+
+    def _request(self, prepare, parse=None, command=None):
+        """Send a request built by ``prepare`` within the rate limit.
+
+        Connection failures, server errors and rate limit rejections are
+        retried with jittered exponential backoff, stale nonces at once, as
+        long as both the per-call retries and the shared retry budget allow
+        it. ``prepare`` is called again on every attempt so signed requests
+        get a new nonce.
+
+        ``UNSAFE_COMMANDS`` are only retried when the request never reached
+        the exchange (connection refused, HTTP 429, stale nonce). Any other
+        failure is raised at once: the order may have gone through, check
+        ``open_orders`` before sending it again.
+        """
+        parse = parse or self._parse
+        with timer('request_seconds', command=command):
+            return self._retry(prepare, parse, command)
+
+    def _retry(self, prepare, parse, command):
+        retry = 0
+        while True:
+            self._bucket.acquire()
+            self._budget.deposit()
+            try:
+                with self._slots:
+                    try:
+                        response = self.session.request(timeout=self.timeout,
+                                                        **prepare())
+                        return parse(response)
+                    except requests.RequestException as e:
+                        if _unsent(e):
+                            raise ConnectError(repr(e))
+                        raise TransportError(repr(e))
+            except NonceError as e:
+                # A newer nonce reached the exchange first: not a sign of
+                # trouble, so re-sign at once without touching the budget
+                if retry >= self.backoff.max_retries:
+                    raise RetriesExhausted('{} after {} retries'.format(e, retry))
+                inc('request_retries_total', command=command, error='NonceError')
+                retry += 1
+            except (TransportError, RateLimitError) as e:
+                if (command in UNSAFE_COMMANDS and
+                        not isinstance(e, (ConnectError, RateLimitError))):
+                    raise
+                if retry >= self.backoff.max_retries or not self._budget.withdraw():
+                    raise RetriesExhausted('{} after {} retries'.format(e, retry))
+                delay = self.backoff.delay(retry)
+                logger.warning('{}, retrying in {:.1f}s'.format(e, delay))
+                inc('request_retries_total', command=command,
+                    error=type(e).__name__)
+                time.sleep(delay)
+                retry += 1
+
+    def _check_status(self, response):
+        if response.status_code == 429:
+            raise RateLimitError('HTTP 429 from {}'.format(response.url))
+        if response.status_code >= 500:
+            raise TransportError('HTTP {} from {}'.format(response.status_code,
+                                                          response.url))
+
+    def _parse(self, response):
+        self._check_status(response)
+        try:
+            reply = json.loads(response.content)
+        except ValueError:
+            if response.status_code >= 400:
+                raise APIError('HTTP {} from {}'.format(response.status_code,
+                                                        response.url))
+            raise TransportError('Invalid JSON from {}'.format(response.url))
+        if isinstance(reply, dict) and 'error' in reply:
+            raise api_error(reply['error'])
+        return reply
+
+    def _candle_parser(self, size_hint):
+
+        def parse(response):
+            if response.status_code >= 400:
+                return self._parse(response)
+            decoder = CandleDecoder(size_hint)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                decoder.feed(chunk)
+            return decoder.close()
+
+        return parse
 
-        post_data = self.pub_api + urllib.urlencode(commands)
-        returned = urllib2.urlopen(urllib2.Request(post_data))
+    def pub_api_query(self, commands):
 
-        return json.loads(returned.read())
+        url = self.pub_api + urllib.urlencode(commands)
 
+        return self._request(lambda: {'method': 'GET', 'url': url},
+                             command=commands.get('command'))
 
-    def trading_api_query(self, commands):
+    def trading_api_query(self, commands, parse=None):
 
-        commands['nonce'] = int(time.time() * 1000)
-        post_data = urllib.urlencode(commands)
+        def prepare():
+            commands['nonce'] = self.nonces.next()
+            post_data = urllib.urlencode(commands)
 
-        sign = hmac.new(self.secret, post_data, hashlib.sha512).hexdigest()
-        headers = {'Sign': sign,
-                   'Key': self.apikey}
+            sign = hmac.new(self.secret.encode('utf-8'), post_data.encode('utf-8'),
+                            hashlib.sha512).hexdigest()
+            headers = {'Sign': sign,
+                       'Key': self.apikey,
+                       'Content-Type': 'application/x-www-form-urlencoded'}
+            return {'method': 'POST', 'url': self.trading_api,
+                    'data': post_data, 'headers': headers,
+                    'stream': parse is not None}
 
-        ret = urllib2.urlopen(urllib2.Request(self.trading_api,
-                                              post_data,
-                                              headers))
-        jsonRet = json.loads(ret.read())
+        command = commands.get('command')
+        if parse is not None:
+            return self._request(prepare, parse, command=command)
+        jsonRet = self._request(prepare, command=command)
         return self.post_process(jsonRet)
 
 
+TRADE_COLUMNS = ['pair', 'globalTradeID', 'tradeID', 'orderNumber', 'type',
+                 'category', 'rate', 'amount', 'total', 'fee', 'timestamp']
+
+
+def trades_frame(reply, pair):
+    """Typed frame of a ``returnTradeHistory`` reply, sorted by date.
+
+    A reply for 'all' pairs, a dict of lists, is flattened with a 'pair'
+    column. Dates are parsed in one vectorized call and also kept as an
+    integer UTC ``timestamp``.
+    """
+    if isinstance(reply, dict):
+        frames = [pd.DataFrame(trades).assign(pair=k)
+                  for k, trades in reply.items() if trades]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    else:
+        df = pd.DataFrame(reply).assign(pair=pair)
+    if not len(df):
+        return pd.DataFrame(columns=TRADE_COLUMNS,
+                            index=pd.DatetimeIndex([], name='date'))
+
+    index = pd.DatetimeIndex(pd.to_datetime(df['date'], format='%Y-%m-%d %H:%M:%S'),
+                             name='date')
+    out = pd.DataFrame(index=index)
+    out['pair'] = pd.Categorical(df['pair'].values)
+    for column in ['globalTradeID', 'tradeID', 'orderNumber']:
+        if column in df:
+            # Fixed width, so that every page of a history has the same schema
+            out[column] = pd.to_numeric(df[column].values).astype(np.int64)
+    for column in ['type', 'category']:
+        if column in df:
+            out[column] = pd.Categorical(df[column].values)
+    for column in ['rate', 'amount', 'total', 'fee']:
+        out[column] = df[column].values.astype(np.float64)
+    out['timestamp'] = index.asi8 // 10 ** 9
+    return out.sort_index(kind='mergesort')
+
+
+class ChartBatch(OrderedDict):
+    """Charts keyed by pair, as returned by ``Poloniex.charts``."""
+
+    def __init__(self, *args, **kwargs):
+        super(ChartBatch, self).__init__(*args, **kwargs)
+        self.errors = OrderedDict()
+
+    def panel(self, field=None):
+        """Join the charts in one frame with (pair, field) columns.
+
+        If ``field`` is given only that field is kept, one column per pair.
+        """
+        panel = pd.concat(OrderedDict((pair, chart.df)
+                                      for pair, chart in self.items()),
+                          axis=1)
+        if field is not None:
+            return panel.xs(field, axis=1, level=1)
+        return panel
+
+
 class Chart(object):
 
-    def __init__(self, pair, chart, start, end, period):
+    def __init__(self, pair, chart, start, end, period, dtype=np.float64):
 
         self.pair = pair
         self.json = chart
         self._start = start
         self._end = end
         self._period = period
+        self.dtype = dtype
 
     def __repr__(self):
         return '{} - {} - {} - {}'.format(self.pair,
@@ -237,16 +638,7 @@ class Chart(object):
 
         return self._transform()
 
+    @timed('stage_seconds', stage='transform')
     def _transform(self):
 
-        series = self.json['candleStick']
-        times = perdelta(self.start,
-                         self.end,
-                         timedelta(**delta_inputs(self.period)))
-
-        times = [i for i in times]
-        if len(times) > len(series):
-            times = times[:-1]
-        elif len(times) < len(series):
-            series = series[:-1]
-        return pd.DataFrame(series, index=times)
\ No newline at end of file
+        return to_frame(to_records(self.json['candleStick']), dtype=self.dtype)
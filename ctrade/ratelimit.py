@@ -0,0 +1,88 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import random
+import threading
+import time
+
+__all__ = ['TokenBucket', 'RetryBudget', 'Backoff']
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket.
+
+    ``rate`` tokens are added per second, up to ``capacity``. ``acquire``
+    blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate, capacity=None):
+
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RetryBudget(object):
+    """Limit the retries to a fraction of the requests.
+
+    Every request deposits ``ratio`` and every retry withdraws one, with
+    the balance capped at ``reserve``. A retry storm drains the budget and
+    further retries are refused until normal traffic refills it.
+    """
+
+    def __init__(self, ratio=0.2, reserve=10):
+
+        self.ratio = ratio
+        self.reserve = reserve
+        self._balance = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.reserve, self._balance + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._balance >= 1:
+                self._balance -= 1
+                return True
+            return False
+
+
+class Backoff(object):
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, base=0.5, cap=30, max_retries=5):
+
+        self.base = base
+        self.cap = cap
+        self.max_retries = max_retries
+
+    def delay(self, retry):
+        return random.uniform(0, min(self.cap, self.base * 2 ** retry))
@@ -0,0 +1,128 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+
+from .utils import *
+from .store import CANDLE_DTYPE, to_records, to_frame
+
+__all__ = ['resample_candles', 'resample_ohlcv', 'MultiTimeframe']
+
+# Weekly bars start on Monday, the epoch is a Thursday
+WEEK_ORIGIN = 4 * 86400
+
+
+def _buckets(dates, seconds):
+    origin = WEEK_ORIGIN if seconds % 604800 == 0 else 0
+    return (dates - origin) // seconds * seconds + origin
+
+
+def resample_candles(records, period):
+    """Aggregate sorted candle records into ``period`` bars.
+
+    Bars are labelled with their open time and aligned on the epoch, which
+    matches the candles served by Poloniex for its own periods. Each field is
+    aggregated with one ``reduceat`` over the bucket boundaries.
+    """
+    if not len(records):
+        return np.empty(0, dtype=CANDLE_DTYPE)
+    buckets = _buckets(records['date'], period_seconds(period))
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])
+    ends = np.append(starts[1:], len(records)) - 1
+
+    bars = np.empty(len(starts), dtype=CANDLE_DTYPE)
+    bars['date'] = buckets[starts]
+    bars['open'] = records['open'][starts]
+    bars['close'] = records['close'][ends]
+    bars['high'] = np.maximum.reduceat(records['high'], starts)
+    bars['low'] = np.minimum.reduceat(records['low'], starts)
+    bars['volume'] = np.add.reduceat(records['volume'], starts)
+    bars['quoteVolume'] = np.add.reduceat(records['quoteVolume'], starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = bars['volume'] / bars['quoteVolume']
+    bars['weightedAverage'] = np.where(bars['quoteVolume'] > 0, average,
+                                       bars['close'])
+    return bars
+
+
+def resample_ohlcv(df, period):
+    """Resample a candle frame (as returned by ``Chart.df``) to ``period``."""
+    records = np.empty(len(df), dtype=CANDLE_DTYPE)
+    for field in CANDLE_DTYPE.names:
+        records[field] = df[field].values
+    return to_frame(resample_candles(records, period))
+
+
+class _Records(object):
+    """Growable record array, doubling its capacity when full."""
+
+    def __init__(self, records):
+
+        self._records = np.array(records, dtype=CANDLE_DTYPE)
+        self._n = len(self._records)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def values(self):
+        return self._records[:self._n]
+
+    def last(self):
+        return self._records[self._n - 1] if self._n else None
+
+    def append(self, record):
+        if self._n == len(self._records):
+            grown = np.empty(max(1, 2 * self._n), dtype=CANDLE_DTYPE)
+            grown[:self._n] = self._records[:self._n]
+            self._records = grown
+        self._records[self._n] = record
+        self._n += 1
+
+    def put(self, record):
+        """Replace the last record if it has the same date, else append."""
+        if self._n and self._records['date'][self._n - 1] == record['date']:
+            self._records[self._n - 1] = record
+        else:
+            self.append(record)
+
+
+class MultiTimeframe(object):
+    """Bars of several periods kept in step with one base series.
+
+    Only the base candles are downloaded. ``update`` takes a new candle, or
+    new values of the still open one, and rebuilds the last bar of every
+    period from the base candles of its bucket.
+    """
+
+    def __init__(self, candles, periods=('15m', '30m', '2h', '4h', '1d')):
+
+        self.periods = list(periods)
+        self._base = _Records(to_records(candles))
+        self._bars = {period: _Records(resample_candles(self._base.values, period))
+                      for period in self.periods}
+
+    def __getitem__(self, period):
+        return self.frame(period)
+
+    @property
+    def base(self):
+        return to_frame(self._base.values)
+
+    def frame(self, period):
+        return to_frame(self._bars[period].values)
+
+    def update(self, candles):
+        """Add candles, given as dicts or records, newer than the base."""
+        if isinstance(candles, dict):
+            candles = [candles]
+        for record in to_records(candles):
+            last = self._base.last()
+            if last is not None and record['date'] < last['date']:
+                continue
+            self._base.put(record)
+            base = self._base.values
+            for period in self.periods:
+                bucket = _buckets(record['date'], period_seconds(period))
+                first = np.searchsorted(base['date'], bucket)
+                self._bars[period].put(resample_candles(base[first:], period)[0])
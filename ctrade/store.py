@@ -0,0 +1,194 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import fcntl
+import logging
+from contextlib import contextmanager
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+
+from .utils import *
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+__all__ = ['CandleStore', 'CANDLE_FIELDS', 'CANDLE_DTYPE',
+           'to_records', 'to_frame']
+
+CANDLE_FIELDS = ['date', 'high', 'low', 'open', 'close',
+                 'volume', 'quoteVolume', 'weightedAverage']
+
+CANDLE_DTYPE = np.dtype([(str('date'), np.int64)] +
+                        [(str(field), np.float64) for field in CANDLE_FIELDS[1:]])
+
+
+def to_records(candles):
+    """Convert the candles of a ``returnChartData`` reply to records.
+
+    Poloniex answers an empty range with a single candle dated 0, which
+    is dropped here.
+    """
+    if isinstance(candles, np.ndarray):
+        records = candles.astype(CANDLE_DTYPE, copy=False)
+    else:
+        records = np.array(list(map(itemgetter(*CANDLE_FIELDS), candles)),
+                           dtype=CANDLE_DTYPE)
+    records = records[records['date'] > 0]
+    return records[np.argsort(records['date'], kind='mergesort')]
+
+
+def to_frame(records, dtype=np.float64):
+    """Build a candle frame indexed by the UTC open time of each candle."""
+    index = pd.to_datetime(records['date'], unit='s')
+    columns = {field: records[field].astype(dtype, copy=False)
+               for field in CANDLE_FIELDS[1:]}
+    columns['date'] = records['date']
+    return pd.DataFrame(columns, index=index, columns=sorted(CANDLE_FIELDS))
+
+
+class CandleStore(object):
+    """Append-only store of candles, one binary file per pair and period.
+
+    Each file is a flat array of ``CANDLE_DTYPE`` records sorted by date,
+    so the last stored timestamp and the last N candles are read with a
+    single seek. Writers hold an exclusive lock on a sidecar lock file and
+    a trailing partial record, left by an interrupted write, is discarded.
+    A pair listed after the start of a download has its requested start
+    recorded, so the range before its first candle counts as stored.
+    """
+
+    def __init__(self, root=None):
+
+        if root is None:
+            root = os.path.join(os.path.expanduser("~"), 'data', 'candles')
+        self._root = root
+        if not os.path.isdir(self._root):
+            os.makedirs(self._root)
+
+    def path(self, pair, period):
+        return os.path.join(self._root, '{}-{}.bin'.format(pair, period))
+
+    @contextmanager
+    def _lock(self, pair, period):
+        # A separate file, as replace swaps the data file for a new one
+        fd = os.open(self.path(pair, period) + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def count(self, pair, period):
+        path = self.path(pair, period)
+        if not os.path.isfile(path):
+            return 0
+        return os.path.getsize(path) // CANDLE_DTYPE.itemsize
+
+    def _read(self, pair, period, offset, n):
+        if n <= 0:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        with open(self.path(pair, period), 'rb') as f:
+            f.seek(offset * CANDLE_DTYPE.itemsize)
+            return np.fromfile(f, dtype=CANDLE_DTYPE, count=n)
+
+    def first_timestamp(self, pair, period):
+        records = self._read(pair, period, 0, min(1, self.count(pair, period)))
+        return int(records['date'][0]) if len(records) else None
+
+    def covered_from(self, pair, period):
+        """Start of the range covered by the store, which may be before the
+        first candle if the pair was listed later."""
+        first = self.first_timestamp(pair, period)
+        try:
+            with open(self.path(pair, period) + '.start') as f:
+                start = int(f.read())
+        except (IOError, OSError, ValueError):
+            return first
+        return start if first is None else min(start, first)
+
+    def last_timestamp(self, pair, period):
+        n = self.count(pair, period)
+        records = self._read(pair, period, n - 1, min(1, n))
+        return int(records['date'][0]) if len(records) else None
+
+    def window(self, pair, period, n=None):
+        """Return the last ``n`` candles (all of them if ``n`` is None)."""
+        count = self.count(pair, period)
+        n = count if n is None else min(n, count)
+        return to_frame(self._read(pair, period, count - n, n))
+
+    def append(self, pair, period, candles):
+        """Append the candles newer than the last stored one.
+
+        A candle with the same date as the last stored one replaces it, so
+        the still open candle of the previous sync gets its final values.
+        Returns the number of records written.
+        """
+        records = to_records(candles)
+        path = self.path(pair, period)
+        size = CANDLE_DTYPE.itemsize
+
+        with self._lock(pair, period):
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                n = os.fstat(fd).st_size // size
+                os.ftruncate(fd, n * size)
+                if n:
+                    os.lseek(fd, (n - 1) * size, os.SEEK_SET)
+                    last = np.frombuffer(os.read(fd, size), dtype=CANDLE_DTYPE)
+                    last = int(last['date'][0])
+                    records = records[records['date'] >= last]
+                    if len(records) and records['date'][0] == last:
+                        os.ftruncate(fd, (n - 1) * size)
+                os.lseek(fd, 0, os.SEEK_END)
+                if len(records):
+                    os.write(fd, records.tobytes())
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        return len(records)
+
+    def replace(self, pair, period, candles, start=None):
+        """Atomically replace the stored candles, downloaded from ``start``."""
+        path = self.path(pair, period)
+        with self._lock(pair, period):
+            self._write(path, to_records(candles).tobytes())
+            if start is not None:
+                self._write(path + '.start', str(int(start)).encode('ascii'))
+            elif os.path.isfile(path + '.start'):
+                os.remove(path + '.start')
+
+    def _write(self, path, data):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+
+    def sync(self, polo, pair, period='5m', days_back=0):
+        """Fetch from ``polo`` only the candles missing from the store.
+
+        If the store does not go back ``days_back`` days the whole range is
+        downloaded again and replaces the stored file. The range before the
+        listing of the pair is then known to be empty and is not downloaded
+        again.
+        """
+        start, end = get_start_end(days_back)
+        covered = self.covered_from(pair, period)
+        last = self.last_timestamp(pair, period)
+
+        if last is None or covered > start + PERIODS2SEC[period]:
+            chart = polo.chart(pair, period=period, start=start, end=end,
+                               stream=True)
+            self.replace(pair, period, chart.json['candleStick'], start=start)
+            logger.info('Downloaded {} {} candles for {}'.format(
+                self.count(pair, period), period, pair))
+            return self.count(pair, period)
+
+        chart = polo.chart(pair, period=period, start=last, end=end)
+        return self.append(pair, period, chart.json['candleStick'])
@@ -0,0 +1,407 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import deque, OrderedDict
+import numpy as np
+import pandas as pd
+
+from .indicators import PIVOT_PERIODS
+from .resample import _buckets
+
+__all__ = ['StreamingSMA', 'StreamingEMA', 'StreamingMACD', 'StreamingRSI',
+           'StreamingBBands', 'StreamingStoc', 'StreamingATR',
+           'StreamingPivot', 'StreamingConsecutive']
+
+NaN = float('nan')
+
+
+def _isnan(value):
+    return value != value
+
+
+def _divide(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(a) / np.float64(b))
+
+
+class _Stateful(object):
+    """State of an incremental indicator as plain python values.
+
+    ``get_state`` returns a dict that can be pickled or dumped to JSON and
+    ``set_state`` restores it on an indicator built with the same
+    parameters.
+    """
+
+    def get_state(self):
+        state = {}
+        for k, v in self.__dict__.items():
+            if isinstance(v, _Stateful):
+                v = v.get_state()
+            elif isinstance(v, deque):
+                v = list(v)
+            state[k] = v
+        return state
+
+    def set_state(self, state):
+        for k, v in state.items():
+            current = self.__dict__[k]
+            if isinstance(current, _Stateful):
+                current.set_state(v)
+            elif isinstance(current, deque):
+                self.__dict__[k] = deque(v, maxlen=current.maxlen)
+            else:
+                self.__dict__[k] = v
+
+
+class _EWM(_Stateful):
+    """``Series.ewm(com=com, adjust=False).mean()`` one value at a time.
+
+    Follows the pandas recursion, NaN inputs included, so that the outputs
+    are identical to the batch ones.
+    """
+
+    def __init__(self, com, min_periods=0):
+
+        self.alpha = 1. / (1. + com)
+        self.min_periods = max(min_periods, 1)
+        self.average = NaN
+        self.old_weight = 1.
+        self.nobs = 0
+
+    def update(self, value):
+        observation = not _isnan(value)
+        self.nobs += observation
+        if not _isnan(self.average):
+            self.old_weight *= 1 - self.alpha
+            if observation:
+                if self.average != value:
+                    self.average = ((self.old_weight * self.average +
+                                     self.alpha * value) /
+                                    (self.old_weight + self.alpha))
+                self.old_weight = 1.
+        elif observation:
+            self.average = value
+        return self.average if self.nobs >= self.min_periods else NaN
+
+
+def _span(window):
+    return (window - 1) / 2.
+
+
+class _RollingMean(_Stateful):
+    """Mean of the non NaN values of the last ``window`` values."""
+
+    def __init__(self, window, min_periods=0):
+
+        self.min_periods = min_periods
+        self.values = deque(maxlen=window)
+        self.sum = 0.
+        self.nobs = 0
+
+    def update(self, value):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            if not _isnan(old):
+                self.sum -= old
+                self.nobs -= 1
+        self.values.append(value)
+        if not _isnan(value):
+            self.sum += value
+            self.nobs += 1
+        if self.nobs and self.nobs >= self.min_periods:
+            return self.sum / self.nobs
+        return NaN
+
+
+class _RollingStd(_Stateful):
+    """Sample std of the last ``window`` values with Welford's updates."""
+
+    def __init__(self, window, min_periods=0):
+
+        self.min_periods = min_periods
+        self.values = deque(maxlen=window)
+        self.nobs = 0
+        self.mean = 0.
+        self.ssqdm = 0.
+
+    def update(self, value):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            if not _isnan(old):
+                self.nobs -= 1
+                if self.nobs:
+                    delta = old - self.mean
+                    self.mean -= delta / self.nobs
+                    self.ssqdm -= (self.nobs + 1) * delta * delta / self.nobs
+                else:
+                    self.mean = self.ssqdm = 0.
+        self.values.append(value)
+        if not _isnan(value):
+            self.nobs += 1
+            delta = value - self.mean
+            self.mean += delta / self.nobs
+            self.ssqdm += (self.nobs - 1) * delta * delta / self.nobs
+        if self.nobs >= self.min_periods and self.nobs > 1:
+            return np.sqrt(max(self.ssqdm / (self.nobs - 1), 0.))
+        return NaN
+
+
+class _RollingExtreme(_Stateful):
+    """Rolling max (``sign=1``) or min (``sign=-1``) with a monotonic deque."""
+
+    def __init__(self, window, sign):
+
+        self.window = window
+        self.sign = sign
+        self.count = 0
+        self.candidates = deque()
+
+    def update(self, value):
+        key = self.sign * value
+        if not _isnan(value):
+            while self.candidates and self.candidates[-1][1] <= key:
+                self.candidates.pop()
+            self.candidates.append((self.count, key))
+        while self.candidates and self.candidates[0][0] <= self.count - self.window:
+            self.candidates.popleft()
+        self.count += 1
+        return self.sign * self.candidates[0][1] if self.candidates else NaN
+
+    def set_state(self, state):
+        _Stateful.set_state(self, state)
+        self.candidates = deque(tuple(i) for i in self.candidates)
+
+
+class _Streaming(_Stateful):
+    """Base of the incremental indicators.
+
+    Every indicator defines ``update(candle)``, which takes one candle, any
+    mapping with the candle fields such as a row of ``to_records``, and
+    returns the new row of the indicator with the column names of its batch
+    version. ``run`` feeds it a whole series of candles.
+    """
+
+    def run(self, candles, index=None):
+        """Feed all ``candles`` and return the outputs as a DataFrame."""
+        return pd.DataFrame([self.update(candle) for candle in candles],
+                            index=index)
+
+
+class StreamingSMA(_Streaming):
+
+    def __init__(self, window=50, min_periods=0, column='close'):
+
+        self.column = column
+        self.mean = _RollingMean(window, min_periods)
+
+    def update(self, candle):
+        return OrderedDict([('SMA', self.mean.update(candle[self.column]))])
+
+
+class StreamingEMA(_Streaming):
+
+    def __init__(self, window=50, min_periods=0, column='close'):
+
+        self.column = column
+        self.ewm = _EWM(_span(window), min_periods)
+
+    def update(self, candle):
+        return OrderedDict([('EMA', self.ewm.update(candle[self.column]))])
+
+
+class StreamingMACD(_Streaming):
+
+    def __init__(self, fast_window=12, slow_window=26, signal_window=9,
+                 column='close'):
+
+        self.column = column
+        self.labels = ['macd_{}-{}'.format(fast_window, slow_window),
+                       'macd_signal_{}-{}'.format(fast_window, slow_window)]
+        self.fast = _EWM(_span(fast_window))
+        self.slow = _EWM(_span(slow_window))
+        self.signal = _EWM(_span(signal_window))
+
+    def update(self, candle):
+        value = candle[self.column]
+        macd = self.fast.update(value) - self.slow.update(value)
+        return OrderedDict(zip(self.labels, [macd, self.signal.update(macd)]))
+
+
+class StreamingRSI(_Streaming):
+
+    def __init__(self, window=14, min_periods=0, column='close'):
+
+        self.column = column
+        self.label = 'rsi_{}'.format(window)
+        self.min_periods = min_periods
+        self.count = 0
+        self.previous = NaN
+        self.up = _RollingMean(window, min_periods)
+        self.down = _RollingMean(window, min_periods)
+
+    def update(self, candle):
+        value = candle[self.column]
+        change = 0. if self.count == 0 else value - self.previous
+        self.previous = value
+        self.count += 1
+
+        avg_up = self.up.update(change if change > 0 else 0.)
+        avg_down = self.down.update(-change if change < 0 else 0.)
+        rsi = _divide(avg_up, avg_up + avg_down) * 100
+        if _isnan(rsi) or np.isinf(rsi):
+            rsi = 50.
+        if self.count < self.min_periods:
+            rsi = NaN
+        return OrderedDict([(self.label, rsi)])
+
+
+class StreamingBBands(_Streaming):
+
+    def __init__(self, window=20, min_periods=0, stdev_multiplier=2,
+                 mode='ranges', column='close'):
+
+        self.column = column
+        self.window = window
+        self.stdev_multiplier = stdev_multiplier
+        self.mode = mode
+        self.first = True
+        self.mean = _RollingMean(window, min_periods)
+        self.std = _RollingStd(window, min_periods)
+
+    def update(self, candle):
+        value = candle[self.column]
+        middle = self.mean.update(value)
+        std = self.std.update(value) * self.stdev_multiplier
+        if self.first:
+            std = 0.  # We define the std of one element to be 0
+            self.first = False
+        upper = middle + std
+        lower = middle - std
+        if self.mode == 'spread':
+            return OrderedDict([('bbands_{}'.format(self.window),
+                                 _divide(upper - lower, middle))])
+        return OrderedDict([('bbands_lower_{}'.format(self.window), lower),
+                            ('bbands_middle_{}'.format(self.window), middle),
+                            ('bbands_upper_{}'.format(self.window), upper)])
+
+
+class StreamingStoc(_Streaming):
+
+    def __init__(self, col_labels=('low', 'high', 'close'), k_smooth=0,
+                 d_smooth=3, window=14, min_periods=0):
+
+        self.col_labels = list(col_labels)
+        self.labels = ['%D_{}'.format(window), '%K_{}'.format(window)]
+        self.min_periods = min_periods
+        self.count = 0
+        self.lowest = _RollingExtreme(window, -1)
+        self.highest = _RollingExtreme(window, 1)
+        self.k_smooth = _RollingMean(k_smooth) if k_smooth != 0 else None
+        self.d_smooth = _RollingMean(d_smooth)
+
+    def update(self, candle):
+        low, high, close = [candle[i] for i in self.col_labels]
+        lowest_low = self.lowest.update(low)
+        highest_high = self.highest.update(high)
+        k = _divide(close - lowest_low, highest_high - lowest_low) * 100
+        if self.count < self.min_periods:
+            k = NaN
+        self.count += 1
+
+        if self.k_smooth is not None:
+            k = self.k_smooth.update(k)
+        return OrderedDict(zip(self.labels, [self.d_smooth.update(k), k]))
+
+
+class StreamingATR(_Streaming):
+
+    def __init__(self, col_labels=('low', 'high', 'close'), window=14):
+
+        self.col_labels = list(col_labels)
+        self.label = 'atr_{}'.format(window)
+        self.window = window
+        self.previous = NaN
+        self.seed = []
+        self.ewm = _EWM(1. / (1. / window) - 1)
+
+    def update(self, candle):
+        low, high, close = [candle[i] for i in self.col_labels]
+        ranges = [high - low, abs(high - self.previous), abs(low - self.previous)]
+        ranges = [i for i in ranges if not _isnan(i)]
+        true_range = max(ranges) if ranges else NaN
+        self.previous = close
+
+        if len(self.seed) < self.window - 1:
+            self.seed.append(true_range)
+            atr = NaN
+        elif len(self.seed) == self.window - 1:
+            # Wilder smoothing is seeded with the mean of the first window
+            self.seed.append(true_range)
+            values = [i for i in self.seed if not _isnan(i)]
+            atr = self.ewm.update(np.mean(values) if values else NaN)
+        else:
+            atr = self.ewm.update(true_range)
+        return OrderedDict([(self.label, atr)])
+
+
+class StreamingPivot(_Streaming):
+    """Distance to the pivot levels of the previous day or week.
+
+    Needs the ``date`` of the candles, in seconds since the epoch.
+    """
+
+    def __init__(self, mode='day', column='close'):
+
+        self.column = column
+        self.mode = mode
+        self.seconds = int(PIVOT_PERIODS[mode].total_seconds())
+        self.labels = ['{}_{}_diff'.format(i, mode)
+                       for i in ['P', 'R1', 'S1', 'R2', 'S2', 'R3', 'S3']]
+        self.period = None
+        self.high = NaN
+        self.low = NaN
+        self.close = NaN
+        self.levels = [NaN] * 7
+
+    def _levels(self):
+        pivot = (self.high + self.low + self.close) / 3
+        r1 = 2 * pivot - self.low
+        s1 = 2 * pivot - self.high
+        r2 = pivot - s1 + r1
+        s2 = pivot - (r1 - s1)
+        r3 = pivot - s2 + r2
+        s3 = pivot - (r2 - s2)
+        return [pivot, r1, s1, r2, s2, r3, s3]
+
+    def update(self, candle):
+        value = candle[self.column]
+        period = int(_buckets(int(candle['date']), self.seconds))
+        if period != self.period:
+            if self.period is not None and period - self.seconds == self.period:
+                self.levels = self._levels()
+            else:
+                self.levels = [NaN] * 7
+            self.period = period
+            self.high = self.low = self.close = NaN
+        if not _isnan(value):
+            self.high = value if _isnan(self.high) else max(self.high, value)
+            self.low = value if _isnan(self.low) else min(self.low, value)
+            self.close = value
+        return OrderedDict(zip(self.labels, [value - i for i in self.levels]))
+
+
+class StreamingConsecutive(_Streaming):
+
+    def __init__(self, column='close'):
+
+        self.column = column
+        self.previous = NaN
+        self.up = 0
+        self.down = 0
+
+    def update(self, candle):
+        value = candle[self.column]
+        self.up = self.up + 1 if value > self.previous else 0
+        self.down = self.down + 1 if value < self.previous else 0
+        self.previous = value
+        return OrderedDict([('conseq_up', self.up), ('conseq_down', self.down)])
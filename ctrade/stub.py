@@ -0,0 +1,508 @@
+"""Local stand-in for the Poloniex HTTP API, for offline load testing.
+
+``StubExchange`` serves the public and trading commands used by
+``Poloniex`` from synthetic data, or replays candles recorded in a
+``CandleStore``. Latency, error rate and rate limit are configurable.
+``LoadDriver`` fires calls at it and reports throughput and latency
+percentiles. From the command line:
+
+    python -m ctrade.stub --scenario chart --requests 500 --concurrency 6
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qsl
+
+from .utils import *
+from .manager import Credentials
+from .ratelimit import TokenBucket
+from .store import CANDLE_FIELDS
+
+__all__ = ['StubExchange', 'LoadDriver']
+
+RATE_LIMIT_ERROR = 'Please do not make more than 6 API calls per second.'
+
+
+def _seed(pair):
+    return zlib.crc32(pair.encode('utf-8')) & 0xffffffff
+
+
+def synthetic_candles(pair, start, end, period):
+    """Deterministic candles of ``pair``: the same date always gets the same
+    values, whatever range is requested."""
+    seed = _seed(pair)
+    base = 0.01 + (seed % 1000) / 10000.
+    k = np.arange(start // period, end // period + 1, dtype=np.int64)
+    k = k[k * period >= start]
+
+    def price(k):
+        noise = ((k * 2654435761 + seed) % 1000) / 1000. - 0.5
+        return base * (1 + 0.05 * np.sin(2 * np.pi * k / 288.)
+                       + 0.02 * np.sin(2 * np.pi * k / 97. + seed % 7)
+                       + 0.004 * noise)
+
+    close, open_ = price(k), price(k - 1)
+    spread = 0.002 * (((k * 40503 + seed) % 100) / 100.)
+    volume = 5 + ((k * 69069 + seed) % 500) / 10.
+    return {'date': k * period,
+            'open': open_,
+            'close': close,
+            'high': np.maximum(open_, close) * (1 + spread),
+            'low': np.minimum(open_, close) * (1 - spread),
+            'volume': volume * close,
+            'quoteVolume': volume,
+            'weightedAverage': (open_ + close) / 2}
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def setup(self):
+        time.sleep(self.server.exchange.handshake)
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, obj, code=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = dict(parse_qsl(urlparse(self.path).query))
+        self.dispatch(query, private=False)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        query = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+        self.dispatch(query, private=True)
+
+    def dispatch(self, query, private):
+        exchange = self.server.exchange
+        code, reply = exchange.handle(query, private,
+                                      key=self.headers.get('Key'))
+        self.reply(reply, code)
+
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *args, **kwargs):
+        BaseHTTPServer.HTTPServer.__init__(self, *args, **kwargs)
+        self.connections = set()
+        self.threads = []
+        self.closing = False
+
+    def process_request(self, request, client_address):
+        self.connections.add(request)
+        thread = threading.Thread(target=self.process_request_thread,
+                                  args=(request, client_address))
+        thread.daemon = self.daemon_threads
+        self.threads = [t for t in self.threads if t.is_alive()] + [thread]
+        thread.start()
+
+    def handle_error(self, request, client_address):
+        # Connections dropped by close_connections are expected to fail
+        if not self.closing:
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def shutdown_request(self, request):
+        self.connections.discard(request)
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def close_connections(self, timeout=5):
+        """Drop the idle keep-alive connections still held by handlers and
+        wait for the handlers to finish."""
+        self.closing = True
+        for request in list(self.connections):
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for thread in self.threads:
+            thread.join(timeout)
+
+
+class StubExchange(object):
+    """Poloniex stand-in served on a local port.
+
+    Parameters
+    ----------
+    latency : float
+        Seconds added to every reply, plus up to ``jitter`` more.
+    error_rate : float
+        Fraction of the requests answered with an HTTP 500.
+    rate_limit : float, optional
+        Requests per second accepted before answering 429.
+    handshake : float
+        Seconds spent on every new connection, standing in for the TCP/TLS
+        handshake against the real exchange.
+    store : CandleStore, optional
+        Candles found in the store are replayed instead of synthetic ones.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit=None, handshake=0.0, store=None,
+                 seed=0):
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.handshake = handshake
+        self.store = store
+        self._bucket = TokenBucket(rate_limit) if rate_limit else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._nonces = {}
+        self._orders = {}
+        self._order_number = 0
+        self.counts = defaultdict(int)
+
+        self._server = StubServer((host, port), StubHandler)
+        self._server.exchange = self
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self._server.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.close_connections()
+        self._server.server_close()
+
+    def credentials(self, apikey='stub-key', secret='stub-secret'):
+        credentials = Credentials('poloniex')
+        credentials.credentials.update({'pub_api': self.url + '/public?',
+                                        'trading_api': self.url + '/tradingApi',
+                                        'apikey': apikey,
+                                        'secret': secret})
+        return credentials
+
+    def client(self, **kwargs):
+        """A ``Poloniex`` client talking to this stub."""
+        from .poloniex import Poloniex
+        return Poloniex(credentials=self.credentials(), **kwargs)
+
+    def handle(self, query, private, key=None):
+        command = query.get('command')
+        with self._lock:
+            self.counts[command] += 1
+            delay = self.latency + self.jitter * self._random.random()
+            failed = self._random.random() < self.error_rate
+
+        # Requests are admitted in arrival order, the latency is paid on
+        # the way back
+        if self._bucket is not None and not self._bucket.try_acquire():
+            return 429, {'error': RATE_LIMIT_ERROR}
+        if private:
+            error = self._check_nonce(key, query.get('nonce'))
+            if error:
+                return 422, {'error': error}
+        time.sleep(delay)
+        if failed:
+            return 500, {'error': 'Internal error. Please try again.'}
+
+        handler = getattr(self, 'cmd_' + (command or ''), None)
+        if handler is None:
+            return 400, {'error': 'Invalid command.'}
+        try:
+            return 200, handler(query)
+        except KeyError as e:
+            return 400, {'error': 'Required parameter missing: {}'.format(e)}
+
+    def _check_nonce(self, key, nonce):
+        try:
+            nonce = int(nonce)
+        except (TypeError, ValueError):
+            return 'Invalid nonce parameter.'
+        with self._lock:
+            last = self._nonces.get(key, 0)
+            if nonce <= last:
+                return 'Nonce must be greater than {}. You provided {}.'.format(last, nonce)
+            self._nonces[key] = nonce
+
+    def _last(self, pair):
+        now = int(time.time())
+        return synthetic_candles(pair, now - 300, now, 300)['close'][-1]
+
+    def cmd_returnTicker(self, query):
+        out = {}
+        for i, pair in enumerate(CURRENCY_PAIRS):
+            last = self._last(pair)
+            out[pair] = {'id': i + 1,
+                         'last': '{:.8f}'.format(last),
+                         'lowestAsk': '{:.8f}'.format(last * 1.001),
+                         'highestBid': '{:.8f}'.format(last * 0.999),
+                         'percentChange': '0.00000000',
+                         'baseVolume': '100.00000000',
+                         'quoteVolume': '{:.8f}'.format(100 / last),
+                         'isFrozen': '0',
+                         'high24hr': '{:.8f}'.format(last * 1.05),
+                         'low24hr': '{:.8f}'.format(last * 0.95)}
+        return out
+
+    def cmd_return24Volume(self, query):
+        return {pair: {pair.split('_')[0]: '100.00000000',
+                       pair.split('_')[1]: '1000.00000000'}
+                for pair in CURRENCY_PAIRS}
+
+    def _book(self, pair, depth):
+        last = self._last(pair)
+        steps = np.arange(1, depth + 1)
+        sizes = 1 + (steps * (_seed(pair) % 13)) % 7
+        return {'asks': [['{:.8f}'.format(last * (1 + 0.0005 * i)), float(s)]
+                         for i, s in zip(steps, sizes)],
+                'bids': [['{:.8f}'.format(last * (1 - 0.0005 * i)), float(s)]
+                         for i, s in zip(steps, sizes)],
+                'isFrozen': '0',
+                'seq': int(time.time() * 1000)}
+
+    def cmd_returnOrderBook(self, query):
+        depth = int(query.get('depth', 50))
+        if query['currencyPair'] == 'all':
+            return {pair: self._book(pair, depth) for pair in CURRENCY_PAIRS}
+        return self._book(query['currencyPair'], depth)
+
+    def _candles(self, pair, start, end, period):
+        if self.store is not None:
+            name = {v: k for k, v in PERIODS2SEC.items()}[period]
+            if self.store.count(pair, name):
+                df = self.store.window(pair, name)
+                df = df[(df['date'] >= start) & (df['date'] <= end)]
+                return [{field: (int(row[field]) if field == 'date' else float(row[field]))
+                         for field in CANDLE_FIELDS}
+                        for _, row in df.iterrows()]
+        columns = synthetic_candles(pair, start, end, period)
+        return [dict(zip(CANDLE_FIELDS, values))
+                for values in zip(*[columns[field].tolist() for field in CANDLE_FIELDS])]
+
+    def cmd_returnChartData(self, query):
+        candles = self._candles(query['currencyPair'], int(query['start']),
+                                int(query['end']), int(query['period']))
+        if not candles:
+            candles = [{field: 0 for field in CANDLE_FIELDS}]
+        return {'candleStick': candles}
+
+    def cmd_returnBalances(self, query):
+        return {currency: '1.00000000' for currency in self._currencies()}
+
+    def cmd_returnCompleteBalances(self, query):
+        return {currency: {'available': '1.00000000', 'onOrders': '0.00000000',
+                           'btcValue': '0.00000000'}
+                for currency in self._currencies()}
+
+    def cmd_returnAvailableAccountBalances(self, query):
+        return {'exchange': self.cmd_returnBalances(query)}
+
+    def cmd_returnFeeInfo(self, query):
+        return {'makerFee': '0.00150000', 'takerFee': '0.00250000',
+                'thirtyDayVolume': '0.00000000', 'nextTier': '600.00000000'}
+
+    def _currencies(self):
+        return sorted(set(c for pair in CURRENCY_PAIRS for c in pair.split('_')))
+
+    def cmd_returnTradeHistory(self, query):
+        pair = query['currencyPair']
+        start = int(query.get('start', time.time() - 86400))
+        end = int(query.get('end', time.time()))
+        pairs = CURRENCY_PAIRS if pair == 'all' else [pair]
+        out = {}
+        for p in pairs:
+            trades = []
+            for t in range(start - start % 3600 + 3600, end + 1, 3600):
+                rate = synthetic_candles(p, t, t, 300)['close'][-1]
+                n = (t // 3600 + _seed(p)) % 1000000
+                trades.append({'globalTradeID': n, 'tradeID': str(n),
+                               'date': datetime.utcfromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S'),
+                               'rate': '{:.8f}'.format(rate),
+                               'amount': '1.00000000',
+                               'total': '{:.8f}'.format(rate),
+                               'fee': '0.00250000',
+                               'orderNumber': str(n),
+                               'type': 'buy' if n % 2 else 'sell',
+                               'category': 'exchange'})
+            out[p] = trades[::-1]
+        return out if pair == 'all' else out[pair]
+
+    def cmd_returnOpenOrders(self, query):
+        pair = query['currencyPair']
+        with self._lock:
+            orders = list(self._orders.values())
+        if pair == 'all':
+            return {p: [o for o in orders if o['pair'] == p] for p in CURRENCY_PAIRS}
+        return [o for o in orders if o['pair'] == pair]
+
+    def _place(self, query, side):
+        with self._lock:
+            self._order_number += 1
+            number = str(self._order_number)
+            self._orders[number] = {'orderNumber': number,
+                                    'pair': query['currencyPair'],
+                                    'type': side,
+                                    'rate': query['rate'],
+                                    'amount': query['amount']}
+        return {'orderNumber': number, 'resultingTrades': []}
+
+    def add_orders(self, orders, side='buy'):
+        """Open the orders given as (pair, order_number), e.g. for a dry
+        run of their cancellation."""
+        with self._lock:
+            for pair, number in orders:
+                number = str(number)
+                self._orders[number] = {'orderNumber': number, 'pair': pair,
+                                        'type': side, 'rate': '0.00000000',
+                                        'amount': '0.00000000'}
+
+    def cmd_buy(self, query):
+        return self._place(query, 'buy')
+
+    def cmd_sell(self, query):
+        return self._place(query, 'sell')
+
+    def cmd_marginBuy(self, query):
+        return dict(self._place(query, 'buy'), success=1)
+
+    def cmd_marginSell(self, query):
+        return dict(self._place(query, 'sell'), success=1)
+
+    def cmd_cancelOrder(self, query):
+        with self._lock:
+            order = self._orders.pop(str(query['orderNumber']), None)
+        if order is None:
+            return {'success': 0,
+                    'error': 'Invalid order number, or you are not the person who placed the order.'}
+        return {'success': 1}
+
+    def cmd_getMarginPosition(self, query):
+        return {'amount': '0.00000000', 'total': '0.00000000',
+                'basePrice': '0.00000000', 'type': 'none'}
+
+    def cmd_closeMarginPosition(self, query):
+        return {'success': 1, 'message': 'You do not have an open position in this market.',
+                'resultingTrades': {}}
+
+
+class LoadDriver(object):
+    """Call ``func`` ``requests`` times from ``concurrency`` threads and
+    report the throughput and latency percentiles."""
+
+    def __init__(self, func, requests=100, concurrency=1):
+
+        self.func = func
+        self.requests = requests
+        self.concurrency = concurrency
+
+    def _call(self, i):
+        t = time.time()
+        try:
+            self.func()
+            error = None
+        except Exception as e:
+            error = e
+        return time.time() - t, error
+
+    def run(self):
+        pool = ThreadPool(self.concurrency)
+        t = time.time()
+        try:
+            results = pool.map(self._call, range(self.requests))
+        finally:
+            pool.close()
+            pool.join()
+        elapsed = time.time() - t
+
+        latencies = np.array([latency for latency, _ in results]) * 1000
+        return {'requests': self.requests,
+                'errors': sum(error is not None for _, error in results),
+                'elapsed': elapsed,
+                'throughput': self.requests / elapsed,
+                'p50': np.percentile(latencies, 50),
+                'p99': np.percentile(latencies, 99)}
+
+    @staticmethod
+    def format(report):
+        return ('{requests} requests, {errors} errors in {elapsed:.2f}s - '
+                '{throughput:.1f} req/s - p50 {p50:.1f}ms - p99 {p99:.1f}ms'
+                .format(**report))
+
+
+SCENARIOS = {
+    'ticker': lambda p: p.ticker(refresh=True),
+    'chart': lambda p: p.chart('BTC_ETH', 15, '15m').df,
+    'orderbook': lambda p: p.book('BTC_ETH', depth=50),
+    'buy': lambda p: p.buy('BTC_ETH', 0.07, 1),
+    'balance': lambda p: p.balance(),
+}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Load test against a local Poloniex stub')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='chart')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', dest='error_rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', dest='rate_limit', type=float, default=None)
+    parser.add_argument('--handshake', type=float, default=0.0)
+    parser.add_argument('--client-rate', dest='client_rate', type=float, default=None,
+                        help='Client side requests per second, defaults to the exchange limit')
+    inputs = parser.parse_args()
+
+    from .poloniex import Poloniex
+    if inputs.client_rate:
+        Poloniex._bucket = TokenBucket(inputs.client_rate)
+
+    with StubExchange(latency=inputs.latency, jitter=inputs.jitter,
+                      error_rate=inputs.error_rate, rate_limit=inputs.rate_limit,
+                      handshake=inputs.handshake) as stub:
+        client = stub.client()
+        scenario = SCENARIOS[inputs.scenario]
+        try:
+            report = LoadDriver(lambda: scenario(client), inputs.requests,
+                                inputs.concurrency).run()
+        finally:
+            client.close()
+        print(LoadDriver.format(report))
+
+
+if __name__ == '__main__':
+    main()
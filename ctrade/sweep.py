@@ -0,0 +1,177 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+import pandas as pd
+
+from .panel import _rolling_extreme
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+__all__ = ['sma_sweep', 'ema_sweep', 'macd_sweep', 'rsi_sweep',
+           'bbands_sweep', 'stoc_sweep']
+
+# Every sweep computes an indicator for a grid of parameters and returns one
+# frame with a column per parameter value, the columns being a MultiIndex
+# when the grid has several parameters or the indicator several outputs. A
+# column is the same as the output of the single indicator with its
+# parameters.
+
+
+def _window_sums(x, windows):
+    """Sums of the trailing ``w`` values of ``x`` for every ``w``, one column
+    per window, from a single cumulative sum."""
+    cumsum = np.concatenate([[0], np.cumsum(x)])
+    end = np.arange(1, len(x) + 1)[:, None]
+    start = np.maximum(end - np.asarray(windows)[None, :], 0)
+    return cumsum[end] - cumsum[start]
+
+
+def _rolling_means(x, windows, min_periods=0):
+    # Infinite values are missing, as in pandas rolling, so that they do not
+    # poison the cumulative sums past their window
+    valid = np.isfinite(x)
+    # Shift by the first value to limit the loss of precision of the sums
+    first = x[valid.argmax()] if valid.any() else 0.
+    count = _window_sums(valid, windows)
+    total = _window_sums(np.where(valid, x - first, 0.), windows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count + first
+    return np.where(count >= max(min_periods, 1), mean, np.NaN)
+
+
+def _ewm(x, window, min_periods=0):
+    """``ema`` of the array ``x``. Without gaps the recursion runs in
+    ``lfilter``, seeded so that the first output is the first value."""
+    if lfilter is None or not len(x) or np.isnan(x).any():
+        return pd.Series(x).ewm(span=window, min_periods=min_periods,
+                                adjust=False).mean().values
+    alpha = 2. / (window + 1)
+    out, _ = lfilter([alpha], [1., alpha - 1.], x, zi=[(1. - alpha) * x[0]])
+    out[:max(min_periods, 1) - 1] = np.NaN
+    return out
+
+
+def _frame(series, values, columns, names=None):
+    if names is not None:
+        columns = pd.MultiIndex.from_tuples(columns, names=names)
+    return pd.DataFrame(values, index=series.index, columns=columns)
+
+
+def sma_sweep(series, windows, min_periods=0):
+    x = series.values.astype(np.float64)
+    return _frame(series, _rolling_means(x, windows, min_periods),
+                  pd.Index(windows, name='window'))
+
+
+def ema_sweep(series, windows, min_periods=0):
+    x = series.values.astype(np.float64)
+    values = np.column_stack([_ewm(x, window, min_periods) for window in windows])
+    return _frame(series, values, pd.Index(windows, name='window'))
+
+
+def macd_sweep(series, fast_windows, slow_windows, signal_window=9):
+    """MACD and signal lines of every fast < slow pair of windows.
+
+    The EMA of each window is computed once and shared by all the pairs it
+    belongs to.
+    """
+    x = series.values.astype(np.float64)
+    emas = dict((window, _ewm(x, window))
+                for window in set(fast_windows) | set(slow_windows))
+    columns, values = [], []
+    for fast in fast_windows:
+        for slow in slow_windows:
+            if fast >= slow:
+                continue
+            macd = emas[fast] - emas[slow]
+            columns += [(fast, slow, 'macd'), (fast, slow, 'macd_signal')]
+            values += [macd, _ewm(macd, signal_window)]
+    return _frame(series, np.column_stack(values), columns,
+                  names=['fast_window', 'slow_window', None])
+
+
+def rsi_sweep(series, windows, min_periods=0):
+    x = series.values.astype(np.float64)
+    change = np.zeros_like(x)
+    change[1:] = x[1:] - x[:-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_up = _rolling_means(np.where(change > 0, change, 0.), windows,
+                                min_periods)
+        avg_down = _rolling_means(np.where(change < 0, -change, 0.), windows,
+                                  min_periods)
+        rsi = avg_up / (avg_up + avg_down) * 100
+    rsi[~np.isfinite(rsi)] = 50
+    if min_periods > 0:
+        rsi[:min_periods-1] = np.NaN
+    return _frame(series, rsi, pd.Index(windows, name='window'))
+
+
+def bbands_sweep(series, windows, stdev_multipliers=(2,), min_periods=0,
+                 mode='spread'):
+    """Bollinger bands of every (window, multiplier) pair.
+
+    The rolling means of all the windows are computed in one pass and the
+    rolling std once per window, only the multiplier is applied per pair.
+    The std is not taken from cumulative sums of squares, which lose too
+    much precision on long series.
+    """
+    x = series.values.astype(np.float64)
+    middle = _rolling_means(x, windows, min_periods)
+    std = np.column_stack([series.rolling(window=window,
+                                          min_periods=min_periods).std().values
+                           for window in windows])
+    std[0] = 0.0  # We define the std of one element to be 0
+
+    columns, values = [], []
+    for i, window in enumerate(windows):
+        for multiplier in stdev_multipliers:
+            upper = middle[:, i] + std[:, i] * multiplier
+            lower = middle[:, i] - std[:, i] * multiplier
+            if mode=='ranges':
+                columns += [(window, multiplier, label)
+                            for label in ['bbands_lower', 'bbands_middle',
+                                          'bbands_upper']]
+                values += [lower, middle[:, i], upper]
+            elif mode=='spread':
+                columns.append((window, multiplier))
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values.append((upper-lower)/middle[:, i])
+    names = ['window', 'stdev_multiplier']
+    if mode=='ranges':
+        names.append(None)
+    return _frame(series, np.column_stack(values), columns, names=names)
+
+
+def stoc_sweep(df, windows, k_smooths=(0,), d_smooth=3,
+               col_labels=('low', 'high', 'close'), min_periods=0):
+    """%K and %D of every (window, k_smooth) pair.
+
+    The rolling extremes are computed once per window and the smoothings of
+    each %K line in one pass over all the ``k_smooths``.
+    """
+    low = df[col_labels[0]].values.astype(np.float64)[:, None]
+    high = df[col_labels[1]].values.astype(np.float64)[:, None]
+    close = df[col_labels[2]].values.astype(np.float64)
+
+    columns, values = [], []
+    for window in windows:
+        lowest_low = _rolling_extreme(low, window, np.fmin)[:, 0]
+        highest_high = _rolling_extreme(high, window, np.fmax)[:, 0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            k = (close - lowest_low) / (highest_high - lowest_low) * 100
+        if min_periods > 0:
+            k[:min_periods] = np.NaN
+
+        smooth = [i for i in k_smooths if i != 0]
+        smoothed = dict(zip(smooth, _rolling_means(k, smooth).T)) if smooth else {}
+        smoothed[0] = k
+        for k_smooth in k_smooths:
+            d = _rolling_means(smoothed[k_smooth], [d_smooth])[:, 0]
+            columns += [(window, k_smooth, '%D'), (window, k_smooth, '%K')]
+            values += [d, smoothed[k_smooth]]
+    return _frame(df, np.column_stack(values), columns,
+                  names=['window', 'k_smooth', None])
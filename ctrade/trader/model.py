@@ -2,11 +2,18 @@ from ctrade.indicators import *
 from ctrade.manager import *
 from ctrade.utils import *
 from ctrade.messages import *
+from ctrade.graph import IndicatorGraph
+from ctrade.instrument import timed
 from model_utils import *
-import copy
-from collections import OrderedDict
+from sklearn.base import clone
+from sklearn.utils import check_random_state
+try:
+    from joblib import Parallel, delayed
+except ImportError:
+    from sklearn.externals.joblib import Parallel, delayed
 from datetime import datetime
 import os
+import numbers
 import scipy.stats as st
 
 DATA_FORMAT = "%Y-%m-%d %H:%M"
@@ -20,27 +27,88 @@ def clean_dataset(X, Y):
     return X, Y
 
 
+def _fit_horizon(estimator, X, index, columns, y, folds, random_state,
+                 n_jobs, cv, embargo):
+
+    # X is the feature matrix memmapped by joblib, wrapped without a copy
+    X = pd.DataFrame(X, index=index, columns=columns, copy=False)
+    y = pd.Series(y, index=index)
+    if cv == 'walkforward':
+        return do_walkforward_crossval(estimator, X, y, folds=folds,
+                                       embargo=embargo, refit=True,
+                                       plot=False, n_jobs=n_jobs)[:2]
+    return do_easy_crossval(estimator, X, y, folds=folds, refit=True,
+                            plot=False, random_state=random_state,
+                            n_jobs=n_jobs)[:2]
+
+
 class StackModels(object):
+    """One estimator per target horizon, stacked on their predictions.
+
+    The horizons are trained on ``n_jobs`` processes, which share the
+    feature matrix through a memmap rather than each receiving a pickled
+    copy. With a ``random_state`` every horizon gets its own seed, for the
+    folds and the estimator, and the results are the same whatever
+    ``n_jobs``. The folds of a horizon can themselves be spread over
+    ``cv_jobs`` processes.
+
+    ``cv`` is 'kfold', shuffled folds, or 'walkforward', expanding windows
+    with warm started refits (see ``do_walkforward_crossval``). The
+    ``embargo`` between the train and test rows defaults to the horizon,
+    over which the targets overlap.
+    """
     
-    def __init__(self, estimator):
+    def __init__(self, estimator, n_jobs=1, random_state=None, cv_jobs=1,
+                 cv='kfold', embargo=None):
         self.estimator = estimator
+        self.n_jobs = n_jobs
+        self.cv_jobs = cv_jobs
+        self.cv = cv
+        self.embargo = embargo
+        self.random_state = random_state
         self.fitted_estimators = []
         self.oob_predictions = []
         self.labels = []
         self.factors = []
+
+    def _estimators(self, n):
+
+        rng = check_random_state(self.random_state)
+        for _ in range(n):
+            estimator = clone(self.estimator)
+            seed = None
+            if self.random_state is not None:
+                seed = rng.randint(np.iinfo(np.int32).max)
+                if 'random_state' in estimator.get_params():
+                    estimator.set_params(random_state=seed)
+            yield estimator, seed
+        
+    def _embargo(self, horizon):
+
+        if self.embargo is not None:
+            return self.embargo
+        return horizon if isinstance(horizon, numbers.Integral) else 0
         
     def fit(self, X, Y):
 
-        for icol,col in enumerate(Y.columns):
-            self.factors.append(Y.iloc[:, icol].std())
-            res = do_easy_crossval(self.estimator, X, Y[col]/self.factors[icol],
-                                   folds=10, refit=True, plot=False)
-            self.fitted_estimators.append(copy.deepcopy(res[1]))
-            self.oob_predictions.append(res[0].sort_index()
+        self.factors = [Y.iloc[:, icol].std() for icol in range(Y.shape[1])]
+        # Arrays above max_nbytes are dumped once and memmapped by the workers
+        results = Parallel(n_jobs=self.n_jobs, max_nbytes='1M')(
+            delayed(_fit_horizon)(estimator, X.values, X.index, X.columns,
+                                  Y.iloc[:, icol].values / self.factors[icol],
+                                  10, seed, self.cv_jobs, self.cv,
+                                  self._embargo(Y.columns[icol]))
+            for icol, (estimator, seed) in enumerate(
+                self._estimators(Y.shape[1])))
+
+        for col, (oob, estimator) in zip(Y.columns, results):
+            self.fitted_estimators.append(estimator)
+            self.oob_predictions.append(oob.sort_index()
                                         .rename(columns={k:'{}_{}'.format(k, col) \
-                                                         for k in res[0].columns}))
+                                                         for k in oob.columns}))
             self.labels.append('pred_{}'.format(col))
             
+    @timed('stage_seconds', stage='stack_predict')
     def predict(self, X):
     
         predictions = []
@@ -68,28 +136,35 @@ class StackModels(object):
 
 class Model(object):
     
-    def __init__(self, indicators, currency):
+    def __init__(self, indicators, currency, max_workers=1, cache=None):
         self.indicators = indicators
         self.currency = currency
-        self.indicator_func = OrderedDict()
+        self.max_workers = max_workers
+        self.cache = cache
+        self.graph = None
         
     def set_indicators(self):
+
+        # The graph computes every indicator, through the cache if any
+        self.graph = IndicatorGraph(self.indicators, self.currency,
+                                    max_workers=self.max_workers)
         
-        def feed(x):
-            return {} if x is None else x
-        
-        for k,v in self.indicators.items():
-            if v[0] in ['macd', 'rsi', 'bbands', 'pivot', 'consecutive_periods']:
-                self.indicator_func[k] = with_series(self.currency)\
-                    (indicator_partial(globals()[v[0]], **feed(v[1])))
-            else:
-                self.indicator_func[k] = indicator_partial(globals()[v[0]],
-                                                           **feed(v[1]))
-        
+    @timed('stage_seconds', stage='features')
     def get_data(self, df):
-        
-        return reduce(lambda x,y: pd.concat([x,y], axis=1), 
-                      [func(df) for func in self.indicator_func.values()])
+
+        # The indicators are evaluated by the graph (on max_workers threads),
+        # their columns are then copied once into a single float matrix
+        outputs = [out.to_frame() if isinstance(out, pd.Series) else out
+                   for out in self.graph.evaluate(df, cache=self.cache).values()]
+        columns = [col for out in outputs for col in out.columns]
+        matrix = np.empty((len(df), len(columns)), dtype=np.float64)
+        i = 0
+        for out in outputs:
+            if not out.index.equals(df.index):
+                out = out.reindex(df.index)
+            matrix[:, i:i+out.shape[1]] = out.values
+            i += out.shape[1]
+        return pd.DataFrame(matrix, index=df.index, columns=columns, copy=False)
     
     def get_target(self, Y, span=[2, 5, 10, 25, 50, 100]):
         
@@ -148,6 +223,7 @@ class Signals(object):
         
         return df
     
+    @timed('stage_seconds', stage='signals_predict')
     def predict(self, X):
         
         for col in X.columns:
@@ -206,6 +282,7 @@ class Status(object):
     def price(self, value):
         self._price = value
 
+    @timed('stage_seconds', stage='status_notify')
     def notify(self):
 
         date = datetime.now().strftime(DATA_FORMAT)
@@ -238,6 +315,7 @@ class Status(object):
         logging.info(msg)
         post_message('cryptobot', msg, username='cryptobot', icon=':matrix:')
 
+    @timed('stage_seconds', stage='status_update')
     def update(self, last_signal):
 
         value = last_signal['signal'].iloc[-1]
@@ -3,44 +3,68 @@ from sklearn.model_selection import (KFold, StratifiedKFold)
 from sklearn.feature_selection import (f_classif, f_regression,
                                        SelectPercentile)
 from sklearn.dummy import DummyClassifier, DummyRegressor
+from sklearn.base import clone
+try:
+    from sklearn.ensemble._gb import BaseGradientBoosting
+except ImportError:
+    from sklearn.ensemble.gradient_boosting import BaseGradientBoosting
+try:
+    from joblib import Parallel, delayed
+except ImportError:
+    from sklearn.externals.joblib import Parallel, delayed
+import numpy as np
 import pandas as pd
 
 
-def do_easy_crossval(estimator, X, Y, transformer=None, W=None, 
-                     refit=True, plot=True, folds=5):
+def _fit_fold(estimator, X, Y, W, train_index, test_index, transformer,
+              proba):
 
-    kf = ModelType(estimator).cv(n_splits=folds, shuffle=True)
-    modeltype = ModelType(estimator)._modeltype
-    Y_score = OrderedDict(); Yte = OrderedDict(); Y_pred = OrderedDict(); i=0
-    Wte = OrderedDict()
-    crossval_prediction = pd.DataFrame(0,
-                                       index=X.index,
-                                       columns=['true', 'pred', 'proba'])
-    crossval_prediction['true'] = Y.values
-    folds = 1
+    # X is the one feature array shared by the folds, only the rows of the
+    # fold are gathered for the fit and the predictions
+    Xtr, Xte = X[train_index], X[test_index]
+    Ytr = Y[train_index]
+    if transformer is not None:
+        Xtr = transformer.fit_transform(Xtr, Ytr)
+        Xte = transformer.transform(Xte)
+    if W is not None:
+        estimator.fit(Xtr, Ytr, sample_weight=W[train_index].ravel())
+    else:
+        estimator.fit(Xtr, Ytr)
+    pred = estimator.predict(Xte)
+    if proba:
+        return test_index, pred, estimator.predict_proba(Xte)[:,1]
+    return test_index, pred, None
 
-    split = kf.split(X) if modeltype=='regressor' else kf.split(X,Y)
 
-    for train_index, test_index in split:
-        Xtr, Xte = X.iloc[train_index,:], X.iloc[test_index,:]
-        Ytr, Yte[i] = Y.iloc[train_index], Y.iloc[test_index]
-        if W is not None:
-            Wtr, Wte[i] = W.iloc[train_index], W.iloc[test_index]
-        if transformer is not None:
-            Xtr = transformer.fit_transform(Xtr, Ytr)
-            Xte = transformer.transform(Xte)
-        if W is not None:
-            estimator.fit(Xtr, Ytr, sample_weight=Wtr.values.ravel())
-        else:
-            estimator.fit(Xtr, Ytr)
-        crossval_prediction.iloc[test_index, 1] = estimator.predict(Xte)
+def do_easy_crossval(estimator, X, Y, transformer=None, W=None, 
+                     refit=True, plot=True, folds=5, random_state=None,
+                     n_jobs=1):
 
-        if modeltype == 'classifier':
-            crossval_prediction.iloc[test_index, 2] = estimator.predict_proba(Xte)[:,1]
+    kf = ModelType(estimator).cv(n_splits=folds, shuffle=True,
+                                 random_state=random_state)
+    modeltype = ModelType(estimator)._modeltype
+    split = kf.split(X) if modeltype=='regressor' else kf.split(X,Y)
 
+    # Every fold fits its own clone, on n_jobs processes sharing X through
+    # a memmap, and its out of fold predictions are written in place
+    values = np.zeros((len(X), 3))
+    values[:, 0] = Y.values
+    W_values = W.values if W is not None else None
+    results = Parallel(n_jobs=n_jobs, max_nbytes='1M')(
+        delayed(_fit_fold)(clone(estimator), X.values, Y.values, W_values,
+                           train_index, test_index,
+                           clone(transformer) if transformer is not None else None,
+                           modeltype == 'classifier')
+        for train_index, test_index in split)
+
+    for fold, (test_index, pred, proba) in enumerate(results):
+        values[test_index, 1] = pred
+        if proba is not None:
+            values[test_index, 2] = proba
         if plot:
-            print 'Trained fold {}'.format(folds)
-        folds += 1
+            print 'Trained fold {}'.format(fold + 1)
+    crossval_prediction = pd.DataFrame(values, index=X.index,
+                                       columns=['true', 'pred', 'proba'])
         
     if not refit:
         return crossval_prediction
@@ -52,6 +76,85 @@ def do_easy_crossval(estimator, X, Y, transformer=None, W=None,
     return crossval_prediction, estimator, transformer, X.columns
 
 
+def walk_forward_split(n, folds=5, embargo=0, min_train=None):
+    """Expanding windows over ``n`` ordered rows.
+
+    The rows after the first ``min_train`` (by default one block) are cut
+    in ``folds`` consecutive test blocks. Each block is predicted by a
+    model trained on all the rows before it but the last ``embargo``,
+    whose targets overlap the block.
+    """
+    if min_train is None:
+        min_train = n // (folds + 1)
+    test_size = (n - min_train) // folds
+    if min_train - embargo <= 0 or test_size <= 0:
+        raise ValueError('Not enough rows for {} folds with an embargo of {}'
+                         .format(folds, embargo))
+    for k in range(folds):
+        test_start = min_train + k * test_size
+        test_end = n if k == folds - 1 else test_start + test_size
+        yield np.arange(test_start - embargo), np.arange(test_start, test_end)
+
+
+def do_walkforward_crossval(estimator, X, Y, W=None, refit=True, plot=True,
+                            folds=5, embargo=0, min_train=None,
+                            warm_start=True, warm_stages=None, n_jobs=1):
+    """Out of sample predictions of ``estimator`` on walk forward windows.
+
+    With ``warm_start``, for gradient boosting estimators, one model is
+    carried through the validation windows: the first window fits
+    ``n_estimators`` stages and every following one adds ``warm_stages``
+    (by default ``n_estimators // folds``) trained on the grown window.
+    Other estimators, bagging ones included, fit their own clone per
+    window, on ``n_jobs`` processes.
+
+    Rows before the first test block have no prediction (NaN). With
+    ``refit`` the returned estimator is a clone fitted from scratch on all
+    the rows, the warm started model only serves the validation. Returns
+    the same as ``do_easy_crossval``.
+    """
+    modeltype = ModelType(estimator)._modeltype
+    splits = list(walk_forward_split(len(X), folds, embargo, min_train))
+    warm_start = warm_start and isinstance(estimator, BaseGradientBoosting)
+
+    values = np.zeros((len(X), 3))
+    values[:, 0] = Y.values
+    values[:splits[0][1][0], 1:] = np.NaN
+    W_values = W.values if W is not None else None
+    if warm_start:
+        model = clone(estimator)
+        stages = warm_stages or max(estimator.n_estimators // folds, 1)
+        results = []
+        for fold, (train_index, test_index) in enumerate(splits):
+            if fold:
+                model.set_params(warm_start=True,
+                                 n_estimators=model.n_estimators + stages)
+            results.append(_fit_fold(model, X.values, Y.values, W_values,
+                                     train_index, test_index, None,
+                                     modeltype == 'classifier'))
+    else:
+        results = Parallel(n_jobs=n_jobs, max_nbytes='1M')(
+            delayed(_fit_fold)(clone(estimator), X.values, Y.values, W_values,
+                               train_index, test_index, None,
+                               modeltype == 'classifier')
+            for train_index, test_index in splits)
+
+    for fold, (test_index, pred, proba) in enumerate(results):
+        values[test_index, 1] = pred
+        if proba is not None:
+            values[test_index, 2] = proba
+        if plot:
+            print 'Trained window {}'.format(fold + 1)
+    crossval_prediction = pd.DataFrame(values, index=X.index,
+                                       columns=['true', 'pred', 'proba'])
+
+    if not refit:
+        return crossval_prediction
+    estimator = clone(estimator).fit(X, Y, W)
+
+    return crossval_prediction, estimator, None, X.columns
+
+
 class ModelType(object):
     def __init__(self, estimator):
         self.estimator = estimator
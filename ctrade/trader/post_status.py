@@ -14,15 +14,10 @@ def update_slack(major=['ETH', 'LTC', 'XRP']):
 
 	def build_dataset(currency_pairs, days_back, period):
 	    out = {}
-	    for i in currency_pairs:
-	        completed = False
-	        while not completed:
-	            try:
-	                t = p.chart(i, days_back, period).df
-	                completed = True
-	            except:
-	                pass
+	    batch = p.charts(currency_pairs, days_back, period)
 
+	    for i, chart in batch.items():
+	        t = chart.df
 	        last = (t['close'].iloc[-1] - t['open'].iloc[-1])/t['open'].iloc[-1]
 	        last_day =  (t['close'].iloc[-1] - t['open'].iloc[-7])/t['open'].iloc[-7]
 	        out[i] = (last, last_day)
@@ -4,6 +4,8 @@ import logging
 import argparse
 import time
 from ctrade import *
+from ctrade.exceptions import APIError, TransportError, RetriesExhausted
+from ctrade.instrument import span
 from datetime import datetime
 
 import warnings
@@ -14,6 +16,11 @@ logger = logging.getLogger(__name__)
 
 DATA_FORMAT = "%Y-%m-%d %H:%M"
 
+# Failures of a cycle talking to the exchange, logged without stopping
+EXCHANGE_ERRORS = (APIError, TransportError, RetriesExhausted)
+# Seconds between attempts to train the model at startup
+TRAIN_RETRY_DELAY = 60
+
 class Trading(object):
  
     def __init__(self, pair, indicators):
@@ -26,47 +33,31 @@ class Trading(object):
         self.m = Model(indicators, pair)
         self.status = Status(pair)
         self.manager = FileManager(pair)
+        self.store = CandleStore()
         self.signal = Signals(pair)
 
     def _pull_data(self, days, timeframe):
 
-        maxi = False
-        while not maxi:
-            try:
-                df = self.polo.chart(self.pair, days, timeframe).df
-                maxi = True
-            except:
-                time.sleep(10)
-
+        self.store.sync(self.polo, self.pair, timeframe, days)
+        size = days * 86400 // PERIODS2SEC[timeframe]
+        df = self.store.window(self.pair, timeframe, size)
         df[self.pair] = df['close']
 
         return df
 
     def pull_data(self, days, timeframe):
 
-        if self.manager.islast(save_type='prediction_data'):
-            last_df = self.manager.get_last(save_type='prediction_data')
-            size = last_df.shape[0]
-            df = self._pull_data(0, timeframe)
-            mask = df.index.isin(last_df.index)
-            df = pd.concat([last_df, df[~mask]]).iloc[-size:]
-        else:
-            df = self._pull_data(days, timeframe)
-
-        self.manager.save(df, save_type='prediction_data')
-        self.manager.clear(save_type='prediction_data')
-        df[self.pair] = df['close']
-
-        return df
+        with span('stage_seconds', stage='fetch'):
+            return self._pull_data(days, timeframe)
 
-    def train(self, est, days, timeframe):
+    def train(self, est, days, timeframe, n_jobs=1, cv='kfold'):
 
         logging.info('Pulling the data')
         df = self._pull_data(days, timeframe)
 
         logging.info('Training the model')
         self.m = Model(self.indicators, self.pair)
-        self.model  = StackModels(est)
+        self.model  = StackModels(est, n_jobs=n_jobs, cv=cv)
 
         self.m.set_indicators()
         X = self.m.get_data(df).dropna()
@@ -77,20 +68,27 @@ class Trading(object):
         _ = self.signal.fit(predictions)
         logging.info('Model trained')
 
+    def safe_run(self):
+        try:
+            self.run()
+        except EXCHANGE_ERRORS as e:
+            logging.error('Skipping cycle: {}'.format(e))
+
     def run(self):
         date = datetime.now().strftime(DATA_FORMAT)
         logging.info('{} Doing new predictions'.format(date))
 
-        df = self.pull_data(15, '15m')
-        X = self.m.get_data(df).dropna()
-        last_prediction = self.model.predict(X)
-        save_prediction = last_prediction.iloc[-1]*np.array(self.model.factors)
-        self.manager.save(save_prediction,
-                          save_type='predictions')
-        last_signal = self.signal.predict(last_prediction)
-        last_signal = last_signal.join(df[self.pair], how='inner')
+        with span('stage_seconds', stage='run'):
+            df = self.pull_data(15, '15m')
+            X = self.m.get_data(df).dropna()
+            last_prediction = self.model.predict(X)
+            save_prediction = last_prediction.iloc[-1]*np.array(self.model.factors)
+            self.manager.save(save_prediction,
+                              save_type='predictions')
+            last_signal = self.signal.predict(last_prediction)
+            last_signal = last_signal.join(df[self.pair], how='inner')
 
-        self.status.update(last_signal)
+            self.status.update(last_signal)
 
 
 if __name__=='__main__':
@@ -110,8 +108,23 @@ if __name__=='__main__':
     parser.add_argument('-cp','--currency_pair', dest='pair',
         help='Currency pair to use',
         default='BTC_LTC')
+    parser.add_argument('-j', '--n-jobs', dest='n_jobs', type=int, default=1,
+        help='Processes training the horizons of the model')
+    parser.add_argument('--cv', dest='cv', default='kfold',
+        choices=['kfold', 'walkforward'],
+        help='Validation of the model: shuffled folds or walk forward')
+    parser.add_argument('--metrics-port', dest='metrics_port', type=int,
+        help='Serve the stage timings to Prometheus on this port')
+    parser.add_argument('--metrics-file', dest='metrics_file',
+        help='Append the stage timings to this JSON lines file')
 
     inputs = parser.parse_args()
+    if inputs.metrics_port:
+        PrometheusExporter(port=inputs.metrics_port).start()
+    exporter = None
+    if inputs.metrics_file:
+        exporter = JsonLinesExporter(inputs.metrics_file)
+        metrics.exporters.append(exporter)
     post_message('cryptobot',
     			 'STARTED TRADING {} USING MODEL...'.format(inputs.pair),
     			 username='cryptobot',
@@ -123,14 +136,25 @@ if __name__=='__main__':
                                     max_depth=3,
                                     subsample=0.3)
     trader = Trading(inputs.pair, indicators)
-    trader.train(est, 60, '15m')
-    trader.run()
+    while True:
+        try:
+            trader.train(est, 60, '15m', n_jobs=inputs.n_jobs, cv=inputs.cv)
+            break
+        except EXCHANGE_ERRORS as e:
+            logging.error('Training failed, retrying in {}s: {}'.format(
+                TRAIN_RETRY_DELAY, e))
+            time.sleep(TRAIN_RETRY_DELAY)
+    trader.safe_run()
+    if exporter:
+        exporter.flush()
 
     t = time.time()
     while True:
         if time.time()-t>900:
             t = time.time()
-            trader.run()
+            trader.safe_run()
+            if exporter:
+                exporter.flush()
 
         time.sleep(900)
 
@@ -32,6 +32,13 @@ def delta_inputs(delta):
 
     return inputs
 
+def period_seconds(period):
+    """Length in seconds of a period such as '5m', '1h', '4h', '1d' or '1w'."""
+    if period in PERIODS2SEC:
+        return PERIODS2SEC[period]
+    units = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    return int(period[:-1]) * units[period[-1]]
+
 def format_pair(pair):
     return '/'.join(pair.split('_')[::-1])
 
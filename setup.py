@@ -5,7 +5,7 @@ import sys
 
 
 requires = [
-    'numpy', 'pandas'
+    'numpy', 'pandas', 'requests', 'six'
 ]
 if sys.version_info[0] <= 2:
     py2_requires = ['contextlib2']
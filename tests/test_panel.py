@@ -0,0 +1,43 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+import pandas as pd
+
+from ctrade.indicators import bbands
+from ctrade.panel import panel_bbands
+from ctrade.stub import synthetic_candles
+
+START = 1500000000
+
+
+def _panel(pairs=('BTC_LTC', 'BTC_ETH'), days=730, period=300):
+    columns = dict((pair, synthetic_candles(pair, START, START + days * 86400,
+                                            period)['close'])
+                   for pair in pairs)
+    index = pd.to_datetime(START + period * np.arange(len(columns[pairs[0]])),
+                           unit='s')
+    panel = pd.DataFrame(columns, index=index, columns=list(pairs))
+    # A flat stretch, where sums of squares lose all their precision
+    panel.values[1000:1100] = panel.values[1000]
+    return panel
+
+
+def test_panel_bbands_matches_bbands():
+    panel = _panel()
+    for mode in ['ranges', 'spread']:
+        out = panel_bbands(panel, window=20, mode=mode)
+        for pair in panel.columns:
+            expected = bbands(panel[pair], window=20, mode=mode)
+            got = out[pair] if mode == 'ranges' else out[[pair]]
+            np.testing.assert_allclose(got.values, expected.values,
+                                       rtol=1e-9, atol=1e-12)
+
+
+def test_panel_bbands_flat_window():
+    panel = _panel()
+    spread = panel_bbands(panel, window=20, mode='spread').iloc[1020:1100]
+    for pair in panel.columns:
+        expected = bbands(panel[pair], window=20, mode='spread').iloc[1020:1100]
+        np.testing.assert_allclose(spread[pair].values, expected.values[:, 0],
+                                   rtol=0, atol=1e-12)